@@ -15,21 +15,32 @@ CREATE TABLE IF NOT EXISTS `Provider` (
   `id` int(11) NOT NULL AUTO_INCREMENT,
   `name` varchar(255) DEFAULT NULL,
   PRIMARY KEY (`id`)
-) ENGINE=MyISAM  AUTO_INCREMENT=10001 ;
+) ENGINE=InnoDB  AUTO_INCREMENT=10001 ;
 
+-- scope is a Provider id or 'ALL', so it cannot be a foreign key
+-- InnoDB so /post_rates can replace the whole table in one transaction
 CREATE TABLE IF NOT EXISTS `Rates` (
   `product_id` varchar(50) NOT NULL,
   `rate` int(11) DEFAULT 0,
   `scope` varchar(50) DEFAULT NULL,
-  FOREIGN KEY (scope) REFERENCES `Provider`(`id`)
-) ENGINE=MyISAM ;
+  KEY `ix_rates_scope` (`scope`)
+) ENGINE=InnoDB ;
+
+-- bumped by every /post_rates so bills can record which rate table they used
+CREATE TABLE IF NOT EXISTS `RatesVersion` (
+  `id` tinyint(1) NOT NULL DEFAULT 1,
+  `version` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB ;
+
+INSERT IGNORE INTO `RatesVersion` (`id`, `version`) VALUES (1, 0);
 
 CREATE TABLE IF NOT EXISTS `Trucks` (
   `id` varchar(10) NOT NULL,
   `provider_id` int(11) DEFAULT NULL,
   PRIMARY KEY (`id`),
   FOREIGN KEY (`provider_id`) REFERENCES `Provider`(`id`)
-) ENGINE=MyISAM ;
+) ENGINE=InnoDB ;
 --
 -- Dumping data
 --
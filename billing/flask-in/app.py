@@ -1,5 +1,8 @@
 import os
-from flask import Flask, request, jsonify, send_file
+import io
+import csv
+import tempfile
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 import mysql.connector
 from mysql.connector import Error
 import pandas as pd
@@ -8,11 +11,19 @@ import openpyxl
 import requests
 from datetime import datetime, timedelta
 
+from db import db_connection, pool_stats
+from weight_client import weight_client
+from billing_engine import compute_bill
+from rates_cache import bump_version, rate_cache
+from logs import setup_logging
+from metrics import init_metrics
+
 app = Flask(__name__)
+setup_logging(app)
+init_metrics(app)
 
-# both used by "rates" functions:
+# default sheet for /post_rates:
 XL_DB_IN = "./in/rates.xlsx"
-XL_DB_OUT = os.path.join(os.getcwd(), 'temp_rates.xlsx')
 
 # ready Macros still not in use:
 # DB_IN = "db/in/"
@@ -37,24 +48,14 @@ def get_truck():
 # #########f helper methods ########### #
 
 
-def get_db_connection():
-    """ "connector" to mysql DB"""
-    return mysql.connector.connect(
-        host=os.environ.get("MYSQL_HOST"),
-        user=os.environ.get("MYSQL_USER"),
-        password=os.environ.get("MYSQL_PASSWORD"),
-        database=os.environ.get("MYSQL_DATABASE")
-    )
-
-
 @app.route("/health", methods=["GET"])
 def health():
     try:
-        conn = get_db_connection()
-        conn.close()
-        return jsonify({"status": "OK"}), 200
+        with db_connection():
+            pass  # checkout pings the connection
+        return jsonify({"status": "OK", "pool": pool_stats(), "weight": weight_client.stats()}), 200
     except Error:
-        return jsonify({"status": "Failure"}), 500
+        return jsonify({"status": "Failure", "pool": pool_stats()}), 500
 
 
 @app.route("/provider", methods=["POST"])
@@ -69,12 +70,11 @@ def create_provider():
         if not name:
             return jsonify({"error": "Missing 'name' field"}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO Provider (name) VALUES (%s)", (name,))
-        conn.commit()
-        provider_id = cursor.lastrowid
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO Provider (name) VALUES (%s)", (name,))
+            conn.commit()
+            provider_id = cursor.lastrowid
 
         return jsonify({"provider_id": provider_id}), 201
     except Error as e:
@@ -90,24 +90,60 @@ def update_provider(provider_id):
         if not name:
             return jsonify({"error": "Missing 'name' field"}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE Provider SET name = %s WHERE id = %s", (name, provider_id))
-        conn.commit()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE Provider SET name = %s WHERE id = %s", (name, provider_id))
+            conn.commit()
 
-        if cursor.rowcount == 0:
-            # Check if the provider exists (but value is unchanged)
-            cursor.execute("SELECT 1 FROM Provider WHERE id = %s", (provider_id,))
-            if cursor.fetchone() is None:
-                conn.close()
-                return jsonify({"error": f"No provider found with id {provider_id}"}), 404
+            if cursor.rowcount == 0:
+                # Check if the provider exists (but value is unchanged)
+                cursor.execute("SELECT 1 FROM Provider WHERE id = %s", (provider_id,))
+                if cursor.fetchone() is None:
+                    return jsonify({"error": f"No provider found with id {provider_id}"}), 404
 
-        conn.close()
         return jsonify({"updated_name": name}), 200
     except Error as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/provider/<int:provider_id>/trucks", methods=["GET"])
+def get_provider_trucks(provider_id):
+    """Last known tara and sessions of every truck of a provider, in one call to the weight service."""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM Provider WHERE id = %s", (provider_id,))
+            if cursor.fetchone() is None:
+                return jsonify({"error": f"Provider ID {provider_id} not found"}), 404
+            cursor.execute("SELECT id FROM Trucks WHERE provider_id = %s", (provider_id,))
+            trucks = [row[0] for row in cursor.fetchall()]
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
+
+    if not trucks:
+        return jsonify([]), 200
+    try:
+        res = weight_client.get_items(trucks, request.args.get("from"), request.args.get("to"))
+    except requests.ConnectionError:
+        return jsonify({"error": "Connection error to weight service"}), 503
+    except requests.Timeout:
+        return jsonify({"error": "Weight service timeout"}), 504
+    except requests.RequestException as e:
+        return jsonify({"error": "External request failed", "details": str(e)}), 500
+    if res.status_code != 200:
+        return jsonify({"error": "Failed to fetch truck data"}), 502
+
+    found = {item["id"]: item for item in res.json()["items"]}
+    return jsonify([
+        {
+            "id": truck,
+            "tara": found.get(truck, {}).get("tara", "na"),
+            "sessions": found.get(truck, {}).get("sessions", []),
+        }
+        for truck in trucks
+    ]), 200
+
+
 @app.route("/truck", methods=["POST"])
 def register_truck():
     """Admin links a truck to a provider ID in the system."""
@@ -120,25 +156,22 @@ def register_truck():
         if not truck_id or not provider_id:
             return jsonify({"error": "Missing 'id' or 'provider' field"}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        # Check if provider exists
-        cursor.execute("SELECT 1 FROM Provider WHERE id = %s", (provider_id,))
-        if cursor.fetchone() is None:
-            conn.close()
-            return jsonify({"error": f"Provider ID {provider_id} does not exist"}), 404
+            # Check if provider exists
+            cursor.execute("SELECT 1 FROM Provider WHERE id = %s", (provider_id,))
+            if cursor.fetchone() is None:
+                return jsonify({"error": f"Provider ID {provider_id} does not exist"}), 404
 
-        # Check if truck ID already exists
-        cursor.execute("SELECT 1 FROM Trucks WHERE id = %s", (truck_id,))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify({"error": f"Truck with ID {truck_id} already exists"}), 409
+            # Check if truck ID already exists
+            cursor.execute("SELECT 1 FROM Trucks WHERE id = %s", (truck_id,))
+            if cursor.fetchone():
+                return jsonify({"error": f"Truck with ID {truck_id} already exists"}), 409
 
-        # Insert new truck
-        cursor.execute("INSERT INTO Trucks (id, provider_id) VALUES (%s, %s)", (truck_id, provider_id))
-        conn.commit()
-        conn.close()
+            # Insert new truck
+            cursor.execute("INSERT INTO Trucks (id, provider_id) VALUES (%s, %s)", (truck_id, provider_id))
+            conn.commit()
 
         return jsonify({"status": "registered"}), 201
 
@@ -157,25 +190,22 @@ def update_truck_provider(id):
         if not new_provider_id:
             return jsonify({"error": "Missing 'provider' field"}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        # check truck exists
-        cursor.execute("SELECT 1 FROM Trucks WHERE id = %s", (id,))
-        if cursor.fetchone() is None:
-            conn.close()
-            return jsonify({"error": f"Truck ID {id} does not exist"}), 404
+            # check truck exists
+            cursor.execute("SELECT 1 FROM Trucks WHERE id = %s", (id,))
+            if cursor.fetchone() is None:
+                return jsonify({"error": f"Truck ID {id} does not exist"}), 404
 
-        # check new provider exists
-        cursor.execute("SELECT 1 FROM Provider WHERE id = %s", (new_provider_id,))
-        if cursor.fetchone() is None:
-            conn.close()
-            return jsonify({"error": f"Provider ID {new_provider_id} does not exist"}), 404
+            # check new provider exists
+            cursor.execute("SELECT 1 FROM Provider WHERE id = %s", (new_provider_id,))
+            if cursor.fetchone() is None:
+                return jsonify({"error": f"Provider ID {new_provider_id} does not exist"}), 404
 
-        # update provider_id
-        cursor.execute("UPDATE Trucks SET provider_id = %s WHERE id = %s", (new_provider_id, id))
-        conn.commit()
-        conn.close()
+            # update provider_id
+            cursor.execute("UPDATE Trucks SET provider_id = %s WHERE id = %s", (new_provider_id, id))
+            conn.commit()
 
         return jsonify({"status": "provider updated"}), 200
 
@@ -190,16 +220,10 @@ def get_truck_info(truck_id):
     # if truck_id == "na":
     #     return jsonify({"error": "Invalid truck ID"}), 400
 
-    # item_url = f"http://weight-weight_app-1:5000/item/{truck_id}"
-
-    host_weight=os.environ.get('WEIGHT_DOCKER_HOST','localhost')
-    item_url = f"http://{host_weight}:5000/item/{truck_id}"
-
-    # item_url = f"http://weight-weight_app-1:5000/item/na"
-    # hardcoded - for testing
+    item_url = weight_client.url(f"/item/{truck_id}")
 
     try:
-        res = requests.get(item_url, timeout=5)
+        res = weight_client.get_item(truck_id, request.args.get("from"), request.args.get("to"))
         if res.status_code == 404:
             return jsonify({"error": "Truck not found"}), 404
         elif res.status_code != 200:
@@ -256,74 +280,167 @@ def mock_session(session_id):
 # ###########f mock testing helpers ############## #
 
 
+RATES_COLUMNS = ['Product', 'Rate', 'Scope']
+
+
+def resolve_rates_source():
+    """uploaded file (multipart "file"), else a file name under in/ ("file" in JSON/form), else XL_DB_IN"""
+    upload = request.files.get('file')
+    if upload and upload.filename:
+        return upload, upload.filename
+    body = request.get_json(silent=True) or {}
+    name = body.get('file') or request.form.get('file')
+    if not name:
+        return XL_DB_IN, XL_DB_IN
+    in_dir = os.path.realpath(os.path.dirname(XL_DB_IN))
+    path = os.path.realpath(os.path.join(in_dir, name))
+    if os.path.dirname(path) != in_dir:
+        raise ValueError(f"File must be inside {os.path.dirname(XL_DB_IN)}")
+    return path, path
+
+
+def read_rates(source, name):
+    dtypes = {'Product': str, 'Scope': str}  # keep provider ids like 10001 as text
+    if name.lower().endswith('.csv'):
+        return pd.read_csv(source, dtype=dtypes)
+    return pd.read_excel(source, engine='openpyxl', dtype=dtypes)
+
+
+def validate_rates(df):
+    """vectorized checks; returns (clean rows, list of errors with spreadsheet row numbers)"""
+    df = df[RATES_COLUMNS].copy()
+    df['Product'] = df['Product'].str.strip()
+    df['Scope'] = df['Scope'].str.strip()
+    df['Rate'] = pd.to_numeric(df['Rate'], errors='coerce')
+
+    problems = pd.Series('', index=df.index)
+    problems[df['Product'].isna() | (df['Product'] == '')] += 'missing Product; '
+    problems[df['Scope'].isna() | (df['Scope'] == '')] += 'missing Scope; '
+    problems[df['Rate'].isna()] += 'Rate is not a number; '
+    problems[df['Rate'] < 0] += 'negative Rate; '
+    problems[df.duplicated(['Product', 'Scope'], keep=False)] += 'duplicate Product/Scope; '
+
+    bad = problems != ''
+    errors = [{"row": int(i) + 2, "error": msg.rstrip('; ')} for i, msg in problems[bad].items()]  # +2: header row, 1-based
+    rows = list(zip(df['Product'].tolist(), df['Rate'].round().astype('Int64').tolist(), df['Scope'].tolist()))
+    return rows, errors
+
+
 @app.route('/post_rates', methods=['POST'])
 def load_rates():
-    """take "rates.xlsx" and convert to mysqlDB"""
+    """replace the Rates table with an uploaded sheet or a file from in/ ("rates.xlsx" by default)"""
+    try:
+        source, name = resolve_rates_source()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if not os.path.exists(XL_DB_IN):
-        return jsonify({"error": f"File not found: {XL_DB_IN}"}), 404
+    if isinstance(source, str) and not os.path.exists(source):
+        return jsonify({"error": f"File not found: {os.path.basename(name)}"}), 404
 
     try:
-        df = pd.read_excel(XL_DB_IN, engine='openpyxl')
+        df = read_rates(source, name)
 
         # Validate columns
-        expected_columns = {'Product', 'Rate', 'Scope'}
+        expected_columns = set(RATES_COLUMNS)
         if not expected_columns.issubset(df.columns):
             return jsonify({"error": f"Missing columns. Required: {expected_columns}"}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        rows, errors = validate_rates(df)
+        if errors:
+            return jsonify({"error": "Invalid rows, rates not changed", "rows": errors[:50], "invalidCount": len(errors)}), 400
+        if not rows:
+            # the DELETE below would otherwise empty the Rates table
+            return jsonify({"error": "No rate rows in the file, rates not changed"}), 400
+
+        # atomic replace: a failed upload leaves the previous rates in place, a re-upload never doubles them
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM Rates")
+            cursor.executemany("INSERT INTO Rates (product_id, rate, scope) VALUES (%s, %s, %s)", rows)
+            version = bump_version(cursor)
+            conn.commit()
+            cursor.close()
+        rate_cache.invalidate()
+
+        return jsonify({"message": f"Inserted {len(rows)} rows from {os.path.basename(name)}", "ratesVersion": version}), 200
 
-        for _, row in df.iterrows():
-            cursor.execute("""
-                INSERT INTO Rates (product_id, rate, scope)
-                VALUES (%s, %s, %s)
-            """, (row['Product'], int(row['Rate']), row['Scope']))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        conn.commit()
-        cursor.close()
-        conn.close()
 
-        return jsonify({"message": f"Inserted {len(df)} rows from {XL_DB_IN}"}), 200
+# sheets of the /rates export, in workbook order
+EXPORT_TABLES = {
+    'Provider': "SELECT id, name FROM Provider",
+    'Rates': "SELECT product_id, rate, scope FROM Rates",
+    'Trucks': "SELECT id, provider_id FROM Trucks",
+}
+EXPORT_CHUNK = 1000
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+
+def iter_table(conn, query):
+    """header, then rows in chunks from an unbuffered (server-side) cursor"""
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query)
+        yield [col[0] for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
 
 
+def export_format():
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower()
+    best = request.accept_mimetypes.best_match([XLSX_MIMETYPE, 'text/csv'], default=XLSX_MIMETYPE)
+    return 'csv' if best == 'text/csv' else 'xlsx'
+
 
 @app.route('/rates', methods=['GET'])
 def export_to_excel():
-    """take mysqlDB and convert it to "outer.xlsx" """
+    """stream Provider/Rates/Trucks back as an xlsx workbook, or one table as CSV (?format=csv&sheet=Rates)"""
+    fmt = export_format()
+    if fmt == 'csv':
+        sheet = request.args.get('sheet', 'Rates')
+        if sheet not in EXPORT_TABLES:
+            return jsonify({"error": f"Unknown sheet. One of: {list(EXPORT_TABLES)}"}), 400
+
+        def generate():
+            with db_connection() as conn:
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                for i, row in enumerate(iter_table(conn, EXPORT_TABLES[sheet]), 1):
+                    writer.writerow(row)
+                    if i % EXPORT_CHUNK == 0:
+                        yield buf.getvalue()
+                        buf.seek(0)
+                        buf.truncate()
+                yield buf.getvalue()
+
+        return Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={sheet.lower()}.csv'})
+
+    if fmt != 'xlsx':
+        return jsonify({"error": "format must be xlsx or csv"}), 400
 
     try:
-        # Connect to the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Fetch data using cursor
-        def fetch_table(query):
-            cursor.execute(query)
-            columns = [col[0] for col in cursor.description]
-            rows = cursor.fetchall()
-            return pd.DataFrame(rows, columns=columns)
-
-        provider_df = fetch_table("SELECT * FROM Provider")
-        rates_df = fetch_table("SELECT * FROM Rates")
-        trucks_df = fetch_table("SELECT * FROM Trucks")
-
-        # Write to Excel
-        with pd.ExcelWriter(XL_DB_OUT, engine='openpyxl') as writer:
-            provider_df.to_excel(writer, sheet_name='Provider', index=False)
-            rates_df.to_excel(writer, sheet_name='Rates', index=False)
-            trucks_df.to_excel(writer, sheet_name='Trucks', index=False)
-
-        # Cleanup
-        cursor.close()
-        conn.close()
-
-        return f"Excel file saved at {XL_DB_OUT}"
-        # replace above line, use later to download excel from website:
-        # return send_file(file_path, as_attachment=True)
+        # write-only workbook: rows go straight to the sheet XML, no cell objects are kept
+        workbook = openpyxl.Workbook(write_only=True)
+        with db_connection() as conn:
+            for sheet, query in EXPORT_TABLES.items():
+                worksheet = workbook.create_sheet(sheet)
+                for row in iter_table(conn, query):
+                    worksheet.append(row)
+        # private to this request, spills to an anonymous temp file when large
+        out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        workbook.save(out)
+        out.seek(0)
+        return send_file(out, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name='rates.xlsx')
     except mysql.connector.Error as err:
         return jsonify({"error": str(err)}), 500
 
@@ -348,74 +465,49 @@ def get_bill(provider_id):
     date_to = parse_dt(to_str) or default_to
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # Get provider info
-        cursor.execute("SELECT id, name FROM Provider WHERE id = %s", (provider_id,))
-        provider = cursor.fetchone()
-        if not provider:
-            conn.close()
-            return jsonify({"error": f"Provider ID {provider_id} not found"}), 404
-
-        # Get trucks for provider
-        cursor.execute("SELECT id FROM Trucks WHERE provider_id = %s", (provider_id,))
-        trucks = [row['id'] for row in cursor.fetchall()]
-        truck_count = len(trucks)
-
-        # Get sessions associated with these trucks within date range
-        # Assuming there's a Sessions table with truck_id, session_date columns
-        # Adjust table and column names as per your schema
-        if trucks:
-            format_from = date_from.strftime("%Y-%m-%d %H:%M:%S")
-            format_to = date_to.strftime("%Y-%m-%d %H:%M:%S")
-
-            # Get session IDs and count
-            format_strings = ','.join(['%s'] * len(trucks))  # placeholders for trucks
-            query_sessions = f"""
-                SELECT id FROM Sessions
-                WHERE truck_id IN ({format_strings})
-                  AND session_date BETWEEN %s AND %s
-            """
-            params = trucks + [format_from, format_to]
-            cursor.execute(query_sessions, params)
-            sessions = [row['id'] for row in cursor.fetchall()]
-            session_count = len(sessions)
-        else:
-            sessions = []
-            session_count = 0
-
-        # Get product rates / totals - example
-        # Assuming Rates table and linking with sessions or trucks
-        # This depends on your schema, so this is a generic example:
-        # We'll just fetch all Rates for the provider's products as demo
-
-        cursor.execute("""
-            SELECT product_id, rate, scope FROM Rates
-            WHERE product_id IN (
-                SELECT DISTINCT product_id FROM SessionsProducts
-                WHERE session_id IN (%s)
-            )
-        """ % (','.join(['%s']*session_count) if session_count > 0 else 'NULL'), tuple(sessions) if session_count > 0 else ())
-        rates = cursor.fetchall()
-
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
 
-        return jsonify({
-            "id": provider['id'],
-            "name": provider['name'],
-            "from": date_from.strftime("%Y%m%d%H%M%S"),
-            "to": date_to.strftime("%Y%m%d%H%M%S"),
-            "truckCount": truck_count,
-            "trucks": trucks,
-            "sessionCount": session_count,
-            "sessions": sessions,
-            "rates": rates
-        })
+            # Get provider info
+            cursor.execute("SELECT id, name FROM Provider WHERE id = %s", (provider_id,))
+            provider = cursor.fetchone()
+            if not provider:
+                return jsonify({"error": f"Provider ID {provider_id} not found"}), 404
+
+            # Get trucks for provider
+            cursor.execute("SELECT id FROM Trucks WHERE provider_id = %s", (provider_id,))
+            trucks = [row['id'] for row in cursor.fetchall()]
 
+            # Resolved rates for this provider, from the cache unless /post_rates ran since
+            rates_version, rates = rate_cache.resolved(cursor, provider_id)
     except Error as e:
         return jsonify({"error": str(e)}), 500
 
+    # every session of the provider's trucks in the period, in one call
+    sessions = []
+    if trucks:
+        try:
+            res = weight_client.get_truck_sessions(trucks, date_from.strftime("%Y%m%d%H%M%S"), date_to.strftime("%Y%m%d%H%M%S"))
+        except requests.ConnectionError:
+            return jsonify({"error": "Connection error to weight service"}), 503
+        except requests.Timeout:
+            return jsonify({"error": "Weight service timeout"}), 504
+        except requests.RequestException as e:
+            return jsonify({"error": "External request failed", "details": str(e)}), 500
+        if res.status_code != 200:
+            return jsonify({"error": "Failed to fetch sessions from weight service"}), 502
+        sessions = res.json()["sessions"]
+
+    bill = compute_bill(sessions, trucks, rates)
+    return jsonify({
+        "id": str(provider['id']),
+        "name": provider['name'],
+        "from": date_from.strftime("%Y%m%d%H%M%S"),
+        "to": date_to.strftime("%Y%m%d%H%M%S"),
+        "ratesVersion": rates_version,
+        **bill
+    })
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5500)
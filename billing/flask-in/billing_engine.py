@@ -0,0 +1,63 @@
+# bill computation: sessions from the weight service joined in memory against a provider's trucks and rates
+
+ALL_SCOPE = "ALL"
+
+
+def resolve_rates(rates, provider_id):
+    """(product, rate, scope) rows -> {product: rate}; a rate scoped to the provider beats the ALL rate"""
+    resolved = {}
+    scoped = {}
+    for product, rate, scope in rates:
+        scope = str(scope).strip()
+        if scope == str(provider_id):
+            scoped[str(product)] = rate
+        elif scope.upper() == ALL_SCOPE:
+            resolved[str(product)] = rate
+    resolved.update(scoped)
+    return resolved
+
+
+def compute_bill(sessions, trucks, rates):
+    """
+    sessions: records from weight POST /sessions (or GET /weight?filter=out)
+    trucks:   ids of the provider's trucks
+    rates:    {product: rate} already resolved for the provider
+    """
+    trucks = set(trucks)
+
+    # POST /sessions sends one record per session: its out, or its in while the truck is still inside (skipped).
+    # keyed by session, so a session listed twice (GET /weight rows carry the session id as "id") counts once
+    by_session = {}
+    for record in sessions:
+        if record.get("direction", "out") == "out" and record.get("truck") in trucks:
+            by_session[record.get("session_id", record["id"])] = record
+
+    products = {}
+    billed_trucks = set()
+    for record in by_session.values():
+        billed_trucks.add(record["truck"])
+        totals = products.setdefault(record["produce"], {"count": 0, "amount": 0})
+        totals["count"] += 1
+        if isinstance(record.get("neto"), int):  # "na" when a container tara is unknown
+            totals["amount"] += record["neto"]
+
+    rows = []
+    total = 0
+    for product, totals in sorted(products.items()):
+        rate = rates.get(product, 0)
+        pay = totals["amount"] * rate
+        total += pay
+        rows.append({
+            "product": product,
+            "count": totals["count"],
+            "amount": totals["amount"],
+            "rate": rate,
+            "pay": pay,
+        })
+
+    return {
+        "truckCount": len(billed_trucks),
+        "sessionCount": len(by_session),
+        "products": rows,
+        "total": total,
+    }
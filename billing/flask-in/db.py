@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+
+from metrics import MeteredConnection
+
+# pool settings, overridable from .env
+POOL_SIZE = int(os.environ.get("MYSQL_POOL_SIZE", 5))
+POOL_RECYCLE = int(os.environ.get("MYSQL_POOL_RECYCLE", 3600))  # seconds before a connection is reopened
+POOL_TIMEOUT = float(os.environ.get("MYSQL_POOL_TIMEOUT", 5))  # seconds to wait for a free connection
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_born = {}  # server connection id -> time it was opened, for recycling
+_stats = {
+    "checkouts": 0,
+    "in_use": 0,
+    "waits": 0,
+    "timeouts": 0,
+    "reconnects": 0,
+    "wait_seconds": 0.0,
+}
+
+
+def get_pool():
+    """create the shared pool on first use, so importing the app does not need the DB"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name="billing",
+                    pool_size=POOL_SIZE,
+                    host=os.environ.get("MYSQL_HOST"),
+                    user=os.environ.get("MYSQL_USER"),
+                    password=os.environ.get("MYSQL_PASSWORD"),
+                    database=os.environ.get("MYSQL_DATABASE"),
+                    buffered=True,  # no unread results left behind when a connection goes back to the pool
+                )
+    return _pool
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _checkout():
+    """take a connection, waiting up to POOL_TIMEOUT when all are in use"""
+    pool = get_pool()
+    started = time.monotonic()
+    waited = False
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except PoolError:
+            if time.monotonic() - started >= POOL_TIMEOUT:
+                _bump("timeouts")
+                raise
+            waited = True
+            time.sleep(0.01)
+    if waited:
+        _bump("waits")
+        _bump("wait_seconds", time.monotonic() - started)
+
+    # pre-ping and recycle before handing the connection out
+    try:
+        old_id = conn.connection_id
+        born = _born.get(old_id)
+        if born is not None and time.monotonic() - born > POOL_RECYCLE:
+            conn.reconnect(attempts=1)
+            _bump("reconnects")
+        elif born is not None:
+            conn.ping(reconnect=True, attempts=1)
+        if conn.connection_id != old_id:
+            _born.pop(old_id, None)
+        _born.setdefault(conn.connection_id, time.monotonic())
+    except Exception:
+        conn.close()
+        raise
+    _bump("checkouts")
+    _bump("in_use")
+    return conn
+
+
+@contextmanager
+def db_connection():
+    """pooled connection, always returned to the pool; rolled back if the block raises"""
+    conn = _checkout()
+    try:
+        yield MeteredConnection(conn)  # cursors report their statements to metrics
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        _bump("in_use", -1)
+        conn.close()  # returns it to the pool
+
+
+def pool_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["size"] = POOL_SIZE
+    stats["recycle_seconds"] = POOL_RECYCLE
+    stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+    return stats
@@ -0,0 +1,74 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# records below this level are dropped before their arguments are formatted
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "info").upper()
+# correlation id: taken from the caller or generated, echoed on the response and forwarded to the weight service
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_listener = None
+
+
+def current_request_id():
+    return g.get("request_id") if has_request_context() else None
+
+
+class RequestIdFilter(logging.Filter):
+    # handler filters run in the thread that logs, where the request context is
+    def filter(self, record):
+        record.request_id = current_request_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(app=None):
+    """
+    route every logger through a queue to one stdout writer thread, so a request never waits on stdout;
+    with an app, also assign each request its correlation id
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    if _listener is None:
+        records = queue.SimpleQueue()
+        # the record is rendered to JSON before it is queued (its arguments may change afterwards),
+        # the writer thread only prints it
+        handler = QueueHandler(records)
+        handler.addFilter(RequestIdFilter())
+        handler.setFormatter(JsonFormatter())
+        writer = logging.StreamHandler(sys.stdout)
+        root.addHandler(handler)
+        _listener = QueueListener(records, writer, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # flush what is still queued on shutdown
+    if app is not None:
+        @app.before_request
+        def assign_request_id():
+            g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+
+        @app.after_request
+        def echo_request_id(response):
+            if "request_id" in g:
+                response.headers[REQUEST_ID_HEADER] = g.request_id
+            return response
@@ -0,0 +1,118 @@
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# opt-in: requests slower than this many milliseconds are logged with their slowest SQL statements
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 0))
+SLOW_SQL_STATEMENTS = 5
+MAX_TRACKED_STATEMENTS = 1000  # statements remembered per request for the slow log
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000)
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency until the response starts",
+                            ["method", "route", "status"])
+REQUEST_QUERIES = Histogram("http_request_db_queries", "SQL statements per request", ["method", "route"],
+                            buckets=QUERY_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram("http_request_db_seconds", "Time spent in SQL per request", ["method", "route"])
+REQUEST_WEIGHT_SECONDS = Histogram("http_request_weight_seconds", "Time spent calling the weight service per request",
+                                   ["method", "route"])
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed")
+DB_SECONDS = Counter("db_query_seconds_total", "Time spent in SQL")
+WEIGHT_CALL_SECONDS = Histogram("weight_client_request_duration_seconds", "Calls to the weight service",
+                                ["endpoint", "status"])
+
+
+def _tally():
+    return g.setdefault("io", {"queries": 0, "sql_seconds": 0.0, "statements": [], "weight_seconds": 0.0})
+
+
+def record_query(statement, seconds):
+    DB_QUERIES.inc()
+    DB_SECONDS.inc(seconds)
+    if has_request_context():
+        tally = _tally()
+        tally["queries"] += 1
+        tally["sql_seconds"] += seconds
+        if SLOW_REQUEST_MS and len(tally["statements"]) < MAX_TRACKED_STATEMENTS:
+            tally["statements"].append((seconds, statement))
+
+
+def record_weight_call(endpoint, status, seconds):
+    WEIGHT_CALL_SECONDS.labels(endpoint, status).observe(seconds)
+    if has_request_context():
+        _tally()["weight_seconds"] += seconds
+
+
+class MeteredCursor:
+    """mysql.connector cursor that reports every execute to record_query"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _timed(self, method, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.executemany, operation, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class MeteredConnection:
+    """pooled connection whose cursors are MeteredCursors; everything else goes to the connection"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return MeteredCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def init_metrics(app):
+    """per-route latency, SQL and weight-service time for every request, exposed on GET /metrics"""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        tally = _tally()
+        REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(request.method, route).observe(tally["queries"])
+        REQUEST_SQL_SECONDS.labels(request.method, route).observe(tally["sql_seconds"])
+        REQUEST_WEIGHT_SECONDS.labels(request.method, route).observe(tally["weight_seconds"])
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            slowest = sorted(tally["statements"], key=lambda s: s[0], reverse=True)[:SLOW_SQL_STATEMENTS]
+            app.logger.warning(
+                "slow request %s %s: %.0fms, %d queries, %.0fms in SQL, %.0fms in weight calls; slowest:%s",
+                request.method, request.full_path.rstrip("?"), elapsed * 1000, tally["queries"],
+                tally["sql_seconds"] * 1000, tally["weight_seconds"] * 1000,
+                "".join(f"\n  {seconds * 1000:.1f}ms {' '.join(statement.split())[:500]}" for seconds, statement in slowest),
+            )
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
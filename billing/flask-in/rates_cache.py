@@ -0,0 +1,65 @@
+import threading
+from collections import defaultdict
+
+from billing_engine import ALL_SCOPE
+
+
+def current_version(cursor):
+    cursor.execute("SELECT version FROM RatesVersion WHERE id = 1")
+    row = cursor.fetchone()
+    if row is None:
+        return 0
+    return row["version"] if isinstance(row, dict) else row[0]
+
+
+def bump_version(cursor):
+    """mark the rate table as changed; call inside the transaction that changed Rates"""
+    cursor.execute("UPDATE RatesVersion SET version = version + 1 WHERE id = 1")
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO RatesVersion (id, version) VALUES (1, 1)")
+    return current_version(cursor)
+
+
+class RateCache:
+    """
+    The resolved {product: rate} of every scope in Rates, reloaded only when RatesVersion changes.
+    A bill costs one primary-key read instead of re-reading and re-resolving Rates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self._resolved = {}
+
+    def invalidate(self):
+        with self._lock:
+            self.version = None
+
+    def _load(self, cursor, version):
+        cursor.execute("SELECT product_id, rate, scope FROM Rates")
+        rows = [(r["product_id"], r["rate"], r["scope"]) if isinstance(r, dict) else tuple(r)
+                for r in cursor.fetchall()]
+        # one pass over the rows, same precedence as resolve_rates: a scoped rate beats the ALL rate
+        all_rates = {}
+        scoped = defaultdict(dict)
+        for product, rate, scope in rows:
+            scope = str(scope).strip()
+            if scope.upper() == ALL_SCOPE:
+                all_rates[str(product)] = rate
+            else:
+                scoped[scope][str(product)] = rate
+        resolved = {scope: {**all_rates, **rates} for scope, rates in scoped.items()}
+        resolved[ALL_SCOPE] = all_rates
+        self._resolved, self.version = resolved, version
+
+    def resolved(self, cursor, provider_id):
+        """(version, {product: rate}) for the provider, reloading first if /post_rates ran since the last load"""
+        version = current_version(cursor)
+        with self._lock:
+            if version != self.version:
+                self._load(cursor, version)
+            # providers without scoped rates pay the ALL rates
+            return self.version, self._resolved.get(str(provider_id), self._resolved[ALL_SCOPE])
+
+
+rate_cache = RateCache()
@@ -0,0 +1,62 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from billing_engine import compute_bill, resolve_rates
+
+
+def session(session_id, truck, produce, neto, direction="out"):
+    # a POST /sessions record
+    record = {"session_id": session_id, "id": session_id + 1, "direction": direction, "truck": truck,
+              "bruto": 20000, "produce": produce}
+    if direction == "out":
+        record.update({"truckTara": 6000, "neto": neto})
+    return record
+
+
+# Test that a rate scoped to the provider overrides the ALL rate, whatever the row order
+def test_provider_rate_overrides_all():
+    rows = [("orange", 5, "10001"), ("orange", 2, "ALL"), ("tomato", 3, " all "), ("tomato", 9, "10002")]
+    assert resolve_rates(rows, 10001) == {"orange": 5, "tomato": 3}
+    assert resolve_rates(rows, "10002") == {"orange": 2, "tomato": 9}
+
+# Test that counts, amounts, pay and the total add up per product
+def test_bill_counts_and_total():
+    sessions = [
+        session(1, "T1", "orange", 1000),
+        session(3, "T1", "orange", 500),
+        session(5, "T2", "tomato", 2000),
+    ]
+    bill = compute_bill(sessions, ["T1", "T2", "T3"], {"orange": 2, "tomato": 3})
+    assert bill["truckCount"] == 2
+    assert bill["sessionCount"] == 3
+    assert bill["products"] == [
+        {"product": "orange", "count": 2, "amount": 1500, "rate": 2, "pay": 3000},
+        {"product": "tomato", "count": 1, "amount": 2000, "rate": 3, "pay": 6000},
+    ]
+    assert bill["total"] == 9000
+
+# Test that a product without a rate is listed at rate 0 and an unknown neto adds nothing
+def test_bill_product_without_rate_and_unknown_neto():
+    bill = compute_bill([session(1, "T1", "mandarin", 800), session(3, "T1", "orange", "na")], ["T1"], {"orange": 2})
+    assert bill["products"] == [
+        {"product": "mandarin", "count": 1, "amount": 800, "rate": 0, "pay": 0},
+        {"product": "orange", "count": 1, "amount": 0, "rate": 2, "pay": 0},
+    ]
+    assert bill["total"] == 0
+
+# Test that sessions still inside, other providers' trucks and repeated sessions are not billed
+def test_bill_skips_open_foreign_and_repeated_sessions():
+    sessions = [
+        session(1, "T1", "orange", None, direction="in"),
+        session(3, "T9", "orange", 1000),
+        session(5, "T1", "orange", 700),
+        session(5, "T1", "orange", 700),
+    ]
+    bill = compute_bill(sessions, ["T1"], {"orange": 1})
+    assert bill["sessionCount"] == 1
+    assert bill["truckCount"] == 1
+    assert bill["total"] == 700
+
+# Test that a provider without sessions gets an empty bill
+def test_bill_without_sessions():
+    assert compute_bill([], ["T1"], {"orange": 1}) == {"truckCount": 0, "sessionCount": 0, "products": [], "total": 0}
@@ -0,0 +1,125 @@
+import sys
+import os
+import itertools
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from mysql.connector.errors import InterfaceError, PoolError
+import db
+from metrics import MeteredConnection
+
+server_ids = itertools.count(1)
+
+
+class FakeConnection:
+    # a pooled connection: close() hands it back, reconnect() gets a new server connection id
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection_id = next(server_ids)
+        self.pings = 0
+        self.rollbacks = 0
+        self.ping_error = None
+
+    def ping(self, reconnect=False, attempts=1):
+        if self.ping_error:
+            raise self.ping_error
+        self.pings += 1
+
+    def reconnect(self, attempts=1):
+        self.connection_id = next(server_ids)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.pool.free.append(self)
+
+
+class FakePool:
+    def __init__(self, size):
+        self.free = [FakeConnection(self) for _ in range(size)]
+
+    def get_connection(self):
+        if not self.free:
+            raise PoolError("Failed getting connection; pool exhausted")
+        return self.free.pop()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    fake = FakePool(1)
+    monkeypatch.setattr(db, "_pool", fake)
+    monkeypatch.setattr(db, "_born", {})
+    monkeypatch.setattr(db, "_stats", {key: 0 for key in db._stats})
+    monkeypatch.setattr(db, "POOL_TIMEOUT", 0.2)
+    return fake
+
+
+# Test that a connection is handed out metered, returned on exit and pinged on its next checkout
+def test_checkout_returns_and_pings(pool):
+    with db.db_connection() as conn:
+        assert isinstance(conn, MeteredConnection)
+        assert db.pool_stats()["in_use"] == 1
+        first = conn._conn
+    assert pool.free == [first]
+    assert first.pings == 0  # just opened, nothing to check
+    with db.db_connection():
+        pass
+    assert first.pings == 1
+    stats = db.pool_stats()
+    assert (stats["checkouts"], stats["in_use"], stats["reconnects"]) == (2, 0, 0)
+
+# Test that a connection older than POOL_RECYCLE is reopened instead of pinged
+def test_old_connection_is_recycled(pool):
+    conn = pool.free[0]
+    with db.db_connection():
+        pass
+    old_id = conn.connection_id
+    db._born[old_id] -= db.POOL_RECYCLE + 1
+    with db.db_connection():
+        pass
+    assert conn.connection_id != old_id
+    assert old_id not in db._born and conn.connection_id in db._born
+    assert conn.pings == 0
+    assert db.pool_stats()["reconnects"] == 1
+
+# Test that the block's exception rolls back and the connection still goes back to the pool
+def test_error_in_block_rolls_back(pool):
+    conn = pool.free[0]
+    with pytest.raises(ValueError):
+        with db.db_connection():
+            raise ValueError("bad row")
+    assert conn.rollbacks == 1
+    assert pool.free == [conn]
+    assert db.pool_stats()["in_use"] == 0
+
+# Test that a checkout waits for a connection released within POOL_TIMEOUT
+def test_checkout_waits_for_a_free_connection(pool):
+    held = db._checkout()
+    threading.Timer(0.05, held.close).start()
+    with db.db_connection() as conn:
+        assert conn._conn is held
+    stats = db.pool_stats()
+    assert stats["waits"] == 1
+    assert stats["wait_seconds"] > 0
+
+# Test that an exhausted pool raises PoolError after POOL_TIMEOUT and counts the timeout
+def test_exhausted_pool_times_out(pool):
+    db._checkout()
+    started = time.monotonic()
+    with pytest.raises(PoolError):
+        db._checkout()
+    assert time.monotonic() - started >= db.POOL_TIMEOUT
+    assert db.pool_stats()["timeouts"] == 1
+
+# Test that a connection failing its ping is closed and not counted as checked out
+def test_failed_ping_returns_connection(pool):
+    conn = pool.free[0]
+    with db.db_connection():
+        pass
+    conn.ping_error = InterfaceError("server has gone away")
+    with pytest.raises(InterfaceError):
+        db._checkout()
+    assert pool.free == [conn]
+    assert db.pool_stats()["in_use"] == 0
@@ -0,0 +1,68 @@
+import sys
+import os
+import io
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import pytest
+import app as billing_app
+from app import app, validate_rates
+
+
+def sheet(*rows):
+    return pd.DataFrame(list(rows), columns=['Product', 'Rate', 'Scope']).astype({'Product': object, 'Scope': object})
+
+
+def post_csv(client, text):
+    return client.post('/post_rates', data={'file': (io.BytesIO(text.encode()), 'rates.csv')},
+                       content_type='multipart/form-data')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # any attempt to replace the table fails the test: every case here must be rejected before the DELETE
+    def no_db():
+        raise AssertionError("rates upload reached the database")
+    monkeypatch.setattr(billing_app, 'db_connection', no_db)
+    return app.test_client()
+
+
+# Test that valid rows come back trimmed and rounded, without errors
+def test_validate_rates_accepts_valid_rows():
+    rows, errors = validate_rates(sheet([' orange ', '2.6', 'ALL'], ['tomato', 3, '10001']))
+    assert errors == []
+    assert rows == [('orange', 3, 'ALL'), ('tomato', 3, '10001')]
+
+# Test that missing fields, non-numeric and negative rates and duplicates are reported by spreadsheet row
+def test_validate_rates_reports_bad_rows():
+    _, errors = validate_rates(sheet(
+        ['orange', 'abc', 'ALL'],
+        ['', 1, 'ALL'],
+        ['tomato', -1, None],
+        ['apple', 1, 'ALL'],
+        ['apple', 2, 'ALL'],
+    ))
+    assert errors == [
+        {'row': 2, 'error': 'Rate is not a number'},
+        {'row': 3, 'error': 'missing Product'},
+        {'row': 4, 'error': 'missing Scope; negative Rate'},
+        {'row': 5, 'error': 'duplicate Product/Scope'},
+        {'row': 6, 'error': 'duplicate Product/Scope'},
+    ]
+
+# Test that a sheet without the required header is rejected
+def test_post_rates_rejects_missing_columns(client):
+    res = post_csv(client, 'Product,Price\norange,2\n')
+    assert res.status_code == 400
+    assert 'Missing columns' in res.get_json()['error']
+
+# Test that a sheet with invalid rows is rejected as a whole
+def test_post_rates_rejects_invalid_types(client):
+    res = post_csv(client, 'Product,Rate,Scope\norange,two,ALL\ntomato,3,ALL\n')
+    assert res.status_code == 400
+    assert res.get_json()['rows'] == [{'row': 2, 'error': 'Rate is not a number'}]
+
+# Test that a header-only sheet does not wipe the Rates table
+def test_post_rates_rejects_empty_sheet(client):
+    res = post_csv(client, 'Product,Rate,Scope\n')
+    assert res.status_code == 400
+    assert 'No rate rows' in res.get_json()['error']
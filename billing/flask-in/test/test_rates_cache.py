@@ -0,0 +1,57 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rates_cache import RateCache
+
+
+class FakeCursor:
+    # answers the two queries RateCache runs: the RatesVersion row and the Rates table
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.loads = 0
+        self._result = None
+
+    def execute(self, sql, params=None):
+        if "RatesVersion" in sql:
+            self._result = [{"version": self.version}]
+        else:
+            self.loads += 1
+            self._result = [{"product_id": p, "rate": r, "scope": s} for p, r, s in self.rows]
+
+    def fetchone(self):
+        return self._result[0]
+
+    def fetchall(self):
+        return self._result
+
+
+# Test that the provider's scoped rates override ALL and other providers fall back to ALL
+def test_scoped_rates_override_all():
+    cursor = FakeCursor(1, [("orange", 2, "ALL"), ("tomato", 3, " all "), ("orange", 5, "10001 "), ("mandarin", 7, "10002")])
+    cache = RateCache()
+    assert cache.resolved(cursor, 10001) == (1, {"orange": 5, "tomato": 3})
+    assert cache.resolved(cursor, "10002") == (1, {"orange": 2, "tomato": 3, "mandarin": 7})
+    assert cache.resolved(cursor, 10003) == (1, {"orange": 2, "tomato": 3})
+
+# Test that Rates is read once per version and again after a version bump
+def test_reloads_only_when_version_changes():
+    cursor = FakeCursor(1, [("orange", 2, "ALL")])
+    cache = RateCache()
+    cache.resolved(cursor, 10001)
+    cache.resolved(cursor, 10002)
+    assert cursor.loads == 1
+
+    cursor.version, cursor.rows = 2, [("orange", 4, "ALL"), ("orange", 6, "10001")]
+    assert cache.resolved(cursor, 10001) == (2, {"orange": 6})
+    assert cache.resolved(cursor, 10002) == (2, {"orange": 4})
+    assert cursor.loads == 2
+
+# Test that invalidate forces a reload even when the version did not change
+def test_invalidate_reloads():
+    cursor = FakeCursor(1, [("orange", 2, "ALL")])
+    cache = RateCache()
+    cache.resolved(cursor, 10001)
+    cache.invalidate()
+    cache.resolved(cursor, 10001)
+    assert cursor.loads == 2
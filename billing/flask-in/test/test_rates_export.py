@@ -0,0 +1,90 @@
+import sys
+import os
+import io
+import sqlite3
+from contextlib import contextmanager
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import openpyxl
+import pandas as pd
+import pytest
+import app as billing_app
+from app import app
+
+RATES_CSV = "Product,Rate,Scope\norange,2,ALL\ntomato,3,ALL\norange,5,10001\nmandarin,4,10002\n"
+LOADED = [("orange", 2, "ALL"), ("tomato", 3, "ALL"), ("orange", 5, "10001"), ("mandarin", 4, "10002")]
+
+
+class SqliteCursor:
+    # the mysql.connector cursor calls the routes make, on sqlite3 (%s placeholders, buffered= accepted)
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql.replace("%s", "?"), rows)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SqliteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, **kwargs):
+        return SqliteCursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.executescript("""
+        CREATE TABLE Provider (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE Rates (product_id TEXT, rate INTEGER, scope TEXT);
+        CREATE TABLE Trucks (id TEXT PRIMARY KEY, provider_id INTEGER);
+        CREATE TABLE RatesVersion (id INTEGER PRIMARY KEY, version INTEGER);
+        INSERT INTO Provider VALUES (10001, 'Green'), (10002, 'Orchard');
+        INSERT INTO Trucks VALUES ('T-1', 10001);
+    """)
+
+    @contextmanager
+    def db_connection():
+        yield SqliteConnection(conn)
+    monkeypatch.setattr(billing_app, "db_connection", db_connection)
+    monkeypatch.setattr(billing_app, "EXPORT_CHUNK", 2)  # several chunks even for a few rows
+    client = app.test_client()
+    res = client.post("/post_rates", data={"file": (io.BytesIO(RATES_CSV.encode()), "rates.csv")},
+                      content_type="multipart/form-data")
+    assert res.status_code == 200
+    return client
+
+
+# Test that the CSV export returns the header and exactly the rows /post_rates loaded
+def test_csv_export_round_trip(client):
+    res = client.get("/rates?format=csv&sheet=Rates")
+    assert res.status_code == 200
+    assert res.mimetype == "text/csv"
+    df = pd.read_csv(io.BytesIO(res.data), dtype={"scope": str})
+    assert list(df.columns) == ["product_id", "rate", "scope"]
+    assert list(df.itertuples(index=False, name=None)) == LOADED
+
+# Test that the xlsx export has every sheet in order, and the Rates sheet holds the loaded rows
+def test_xlsx_export_round_trip(client):
+    res = client.get("/rates")
+    assert res.status_code == 200
+    workbook = openpyxl.load_workbook(io.BytesIO(res.data), read_only=True)
+    assert workbook.sheetnames == ["Provider", "Rates", "Trucks"]
+    rows = list(workbook["Rates"].iter_rows(values_only=True))
+    assert rows[0] == ("product_id", "rate", "scope")
+    assert rows[1:] == LOADED
+    assert list(workbook["Trucks"].iter_rows(values_only=True)) == [("id", "provider_id"), ("T-1", 10001)]
+
+# Test that an unknown sheet or format is rejected
+def test_export_rejects_unknown_sheet_and_format(client):
+    assert client.get("/rates?format=csv&sheet=Users").status_code == 400
+    assert client.get("/rates?format=pdf").status_code == 400
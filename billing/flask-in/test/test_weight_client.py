@@ -0,0 +1,108 @@
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+import requests
+import weight_client
+from weight_client import CircuitBreaker, CircuitOpenError, WeightClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(weight_client.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def weight_service():
+    # a stand-in weight service answering every request with the next status of .statuses (200 once they run out)
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.hits += 1
+            status = server.statuses.pop(0) if server.statuses else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.hits = 0
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# Test that the breaker opens after the threshold, lets one trial call through after the reset, and closes on success
+def test_breaker_open_half_open_closed(clock):
+    breaker = CircuitBreaker(threshold=2, reset_after=30)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only the one trial while it is in flight
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+# Test that a failed trial call re-opens the breaker for a full reset period
+def test_breaker_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+# Test that a 5xx is retried RETRIES times on one call, and a call that still fails counts once towards the breaker
+def test_client_retry_budget(weight_service):
+    client = WeightClient(f"http://127.0.0.1:{weight_service.server_port}")
+    weight_service.statuses = [503] * (weight_client.RETRIES + 1)
+    res = client.get("/health")
+    assert res.status_code == 503
+    assert weight_service.hits == weight_client.RETRIES + 1
+    assert client.breaker.failures == 1
+
+    weight_service.statuses = [503]
+    assert client.get("/health").status_code == 200  # recovered within the budget
+    assert weight_service.hits == weight_client.RETRIES + 3
+    assert client.breaker.failures == 0
+
+# Test that an open breaker fails calls without reaching the weight service, and one trial closes it again
+def test_client_short_circuits_while_open(weight_service):
+    client = WeightClient(f"http://127.0.0.1:{weight_service.server_port}")
+    client.breaker = CircuitBreaker(threshold=1, reset_after=30)
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        client.get("/health")
+    assert weight_service.hits == 0
+
+    client.breaker.opened_at -= 30
+    assert client.get("/health").status_code == 200
+    assert client.stats()["breaker"] == "closed"
+    assert weight_service.hits == 1
+
+# Test that a refused connection counts as a failure
+def test_client_connection_error_counts_as_failure(monkeypatch):
+    monkeypatch.setattr(weight_client, "RETRIES", 0)
+    client = WeightClient("http://127.0.0.1:9")
+    with pytest.raises(requests.ConnectionError):
+        client.get("/health")
+    assert client.breaker.failures == 1
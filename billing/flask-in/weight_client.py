@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from logs import REQUEST_ID_HEADER, current_request_id
+from metrics import record_weight_call
+
+# weight service connection settings, overridable from .env
+WEIGHT_HOST = os.environ.get("WEIGHT_DOCKER_HOST", "localhost")
+WEIGHT_PORT = os.environ.get("WEIGHT_PORT", "5000")
+TIMEOUT = float(os.environ.get("WEIGHT_TIMEOUT", 5))
+RETRIES = int(os.environ.get("WEIGHT_RETRIES", 2))
+POOL_SIZE = int(os.environ.get("WEIGHT_POOL_SIZE", 20))  # keep-alive connections kept open
+BREAKER_THRESHOLD = int(os.environ.get("WEIGHT_BREAKER_THRESHOLD", 5))  # consecutive failures before opening
+BREAKER_RESET = float(os.environ.get("WEIGHT_BREAKER_RESET", 30))  # seconds before a trial call is let through
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf"))
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """raised without calling the weight service while the breaker is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False  # the single trial call of the half-open state is in flight
+        self._lock = threading.Lock()
+
+    def _reset_passed(self):
+        return time.monotonic() - self.opened_at >= self.reset_after
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            # half-open: once the reset time has passed, exactly one trial call goes through
+            if self.probing or not self._reset_passed():
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                # a failed trial re-opens for another reset period
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def release(self):
+        """the trial call ended without an answer either way; the next call may try again"""
+        with self._lock:
+            self.probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if self._reset_passed() else "open"
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum_seconds": round(self.total, 4),
+                "buckets": {("+Inf" if b == float("inf") else str(b)): c for b, c in zip(self.buckets, self.counts)},
+            }
+
+
+class WeightClient:
+    """shared keep-alive client for the weight service with retries, a circuit breaker and latency histograms"""
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url or f"http://{WEIGHT_HOST}:{WEIGHT_PORT}"
+        self.session = requests.Session()
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),  # billing only issues read lookups
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breaker = CircuitBreaker()
+        self.histograms = {}
+        self._hist_lock = threading.Lock()
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def _histogram(self, endpoint):
+        with self._hist_lock:
+            if endpoint not in self.histograms:
+                self.histograms[endpoint] = LatencyHistogram()
+            return self.histograms[endpoint]
+
+    def request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+        kwargs.setdefault("timeout", TIMEOUT)
+        request_id = current_request_id()
+        if request_id:
+            # the weight service logs under the same correlation id
+            kwargs["headers"] = {REQUEST_ID_HEADER: request_id, **(kwargs.get("headers") or {})}
+        endpoint = f"{method} /{path.strip('/').split('/')[0]}"
+        started = time.perf_counter()
+        status = "error"
+        try:
+            res = self.session.request(method, self.url(path), **kwargs)
+            status = res.status_code
+        except (requests.ConnectionError, requests.Timeout):
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.release()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._histogram(endpoint).observe(elapsed)
+            record_weight_call(endpoint, status, elapsed)
+        if res.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return res
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params=params)
+
+    def get_item(self, item_id, date_from=None, date_to=None):
+        return self.get(f"/item/{item_id}", params=_range_params(date_from, date_to))
+
+    def get_session(self, session_id):
+        return self.get(f"/session/{session_id}")
+
+    def get_weight(self, date_from=None, date_to=None, directions=None):
+        params = _range_params(date_from, date_to)
+        if directions:
+            params["filter"] = directions
+        return self.get("/weight", params=params)
+
+    def get_items(self, item_ids, date_from=None, date_to=None):
+        """many trucks/containers in one POST /items round-trip"""
+        return self.request("POST", "/items", json={"ids": list(item_ids), **_range_params(date_from, date_to)})
+
+    def get_sessions(self, session_ids):
+        """many sessions in one POST /sessions round-trip"""
+        return self.request("POST", "/sessions", json={"ids": list(session_ids)})
+
+    def get_truck_sessions(self, trucks, date_from=None, date_to=None):
+        """every session of the trucks in the range, one POST /sessions round-trip"""
+        return self.request("POST", "/sessions", json={"trucks": list(trucks), **_range_params(date_from, date_to)})
+
+    def stats(self):
+        with self._hist_lock:
+            histograms = dict(self.histograms)
+        return {
+            "base_url": self.base_url,
+            "breaker": self.breaker.state,
+            "latency": {endpoint: h.snapshot() for endpoint, h in histograms.items()},
+        }
+
+
+def _range_params(date_from, date_to):
+    params = {}
+    if date_from:
+        params["from"] = date_from
+    if date_to:
+        params["to"] = date_to
+    return params
+
+
+# one client per process, shared by all routes
+weight_client = WeightClient()
@@ -64,5 +64,12 @@ run_api_test "POST rates (convert xl to mysql)" \
 # will take from xl and put at DB.
 
 run_api_test "get rates (convert mysql to xl )" \
-curl -s -X GET http://127.0.0.1:5500/rates
-# will create xl from DB with 3 sheets.
+'curl -s -o /tmp/rates.xlsx -w "%{http_code} %{content_type} %{size_download} bytes" http://127.0.0.1:5500/rates'
+# downloads an xl built from the DB with 3 sheets.
+
+run_api_test "get rates as csv" \
+'curl -s "http://127.0.0.1:5500/rates?format=csv&sheet=Rates"'
+
+# === Bill Tests ===
+run_api_test "Bill for provider 10001 (current month)" \
+'curl -s http://127.0.0.1:5500/bill/10001'
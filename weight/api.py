@@ -1,30 +1,56 @@
+import click
 from flask import Flask
 import os
 
 from classes_db import db
 from routes import register_routes
+from commands import check_id_columns, register_commands
+import auxillary_functions
+import logs
+import metrics
 
 
-def create_app():
+def create_app(database_uri=None):
     app = Flask(__name__, template_folder='templates')
+    logs.setup_logging(app)
     # enviromental/global vars go here
     user = os.environ.get('MYSQL_USER')
     password = os.environ.get('MYSQL_PASSWORD')
     host = os.environ.get('MYSQL_HOST')
     db_name = os.environ.get('MYSQL_DATABASE')
-    #set db uri from environment
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{user}:{password}@{host}/{db_name}'
+    #set db uri from environment, unless another database is given (e.g. sqlite for the benchmarks)
+    database_uri = database_uri or os.environ.get('WEIGHT_DATABASE_URI') or f'mysql+pymysql://{user}:{password}@{host}/{db_name}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_uri.startswith('sqlite'):
+        # stand-in database: wait on the file lock instead of failing while a batch job writes
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    else:
+        # explicit pool sizing: keep at least one connection per serving thread (WEB_THREADS in gunicorn.conf.py)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 16)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 4)),  # batch-import workers and bursts
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+            'pool_pre_ping': True,
+        }
 
     db.init_app(app)
     register_routes(app)
+    register_commands(app)
     with app.app_context():
-        from classes_db import Container, Transaction 
+        metrics.init_metrics(app, db.engine)
+        from classes_db import Container, Transaction, TransactionContainer, UnknownContainer, WeightRollup, BatchJob, IdempotencyKey
         db.create_all()
+        if click.get_current_context(silent=True) is None:
+            # serving, not a flask command: those must still load, so that upgrade-schema can widen the columns
+            check_id_columns()
+        auxillary_functions.container_taras.load_all()
     
 
     return app
 
+# development server only; production runs gunicorn -c gunicorn.conf.py "api:create_app()"
 if __name__ == '__main__':
     app = create_app()
     app.run(host='0.0.0.0', port=5000)
@@ -1,25 +1,51 @@
 from datetime import datetime
 import csv
-from sqlalchemy import text, or_, and_
-import sys
+from sqlalchemy import String, and_, exists, insert, literal, or_, select, text, union_all
+import os
 import json
-from flask import jsonify
-
-from classes_db import Container, Transaction, db
+import logging
+import math
+import numpy as np
+
+from classes_db import Container, Transaction, TransactionContainer, UnknownContainer, db, insert_ignore, upsert
+import rollups
+from caches import MISSING, ContainerTareCache, latest_transactions
+from ids import new_transaction_id
+
+log = logging.getLogger(__name__)
+
+# rows per multi-row INSERT when importing container files
+BATCH_SIZE = 1000
+# largest page returned by paginated list endpoints
+MAX_PAGE_SIZE = 10000
+# units accepted on gates and in registry files; everything is stored as integer kg
+LB_UNITS = ('lb', 'lbs')
+KNOWN_UNITS = ('kg',) + LB_UNITS
+LB_PER_KG = 2.205
+
+def load_container_taras(container_ids=None):
+    # {container_id: tara in kg or None}, for the given ids or the whole registry
+    # weights are stored in kg since the import normalizes them (normalize-container-units for older rows)
+    query = db.session.query(Container.container_id, Container.weight)
+    if container_ids is not None:
+        query = query.filter(Container.container_id.in_(container_ids))
+    taras = {}
+    for cid, weight in query:
+        taras[cid] = weight if weight is not None and weight >= 1 else None
+    return taras
+
+# container tares change about once a month, so truck exits, none-weighings and /item read them from memory
+container_taras = ContainerTareCache(load_container_taras, ttl=int(os.environ.get('CONTAINER_CACHE_TTL', 300)))
 
 def container_has_weight_in_table(container_id):
-    container = Container.query.get(container_id)
-    has_weight = True
-    if container.weight is None or container.weight < 1:
-        has_weight = False
-    return has_weight
-
-def id_exists(_id):
-    already_exists = db.session.query(Transaction).filter(Transaction.id==_id).first()
-    ret = False
-    if already_exists is not None:
-        ret = True   
-    return ret
+    return container_taras.get(container_id) is not None
+
+def link_transaction_containers(transaction_id, container_ids):
+    # keep transaction_containers in step with the containers JSON column, same commit
+    for cid in dict.fromkeys(container_ids or []):
+        if cid:
+            db.session.add(TransactionContainer(transaction_id=transaction_id, container_id=cid))
+    mark_unknown_containers(container_ids)
 
 def in_json_and_extras_to_transaciotn(in_json: json, truck_tara, neto, exact_time, id):
     new_transaction = Transaction()
@@ -35,144 +61,389 @@ def in_json_and_extras_to_transaciotn(in_json: json, truck_tara, neto, exact_tim
     new_transaction. truckTara = truck_tara
     return new_transaction
 
-def handle_json_in_file(filepath, added, invalid_weight_field):
+def normalize_container_rows(rows):
+    # whole-chunk conversion to integer kg; the uploaded value is kept in original_weight/original_unit
+    weights = np.fromiter((row['weight'] for row in rows), dtype=float, count=len(rows))
+    pounds = np.isin(np.array([row['unit'] for row in rows]), LB_UNITS)
+    # pounds truncate like lb_to_kg, so taras match the kg values recorded before normalization
+    kg = np.where(pounds, np.trunc(weights / LB_PER_KG), np.rint(weights)).astype(np.int64)
+    return [
+        {'container_id': row['container_id'], 'weight': weight, 'unit': 'kg',
+         'original_weight': row['weight'], 'original_unit': row['unit']}
+        for row, weight in zip(rows, kg.tolist())
+    ]
+
+def taras_of(rows):
+    # {container_id: tara} of registry rows, as load_container_taras reads them back once upserted
+    if not rows:
+        return {}
+    return {row['container_id']: row['weight'] if row['weight'] >= 1 else None for row in normalize_container_rows(rows)}
+
+def upsert_containers(rows):
+    # one multi-row INSERT ... ON DUPLICATE KEY UPDATE per chunk instead of a SELECT per row
+    if not rows:
+        return 0
+    rows = normalize_container_rows(rows)
+    stmt = upsert(db.session, Container, rows, lambda new: {
+        'weight': new.weight,
+        'unit': new.unit,
+        'original_weight': new.original_weight,
+        'original_unit': new.original_unit,
+    })
+    db.session.execute(stmt)
+    refresh_unknown_containers(rows)
+    return len(rows)
+
+# marker yielded by the container file readers for rows that are ignored silently (missing id/weight/unit)
+SKIPPED = 'skipped'
+# characters read per chunk by the streaming JSON parser
+JSON_CHUNK_SIZE = 64 * 1024
+# per-row errors kept for a job's status, the count is always exact
+MAX_ROW_ERRORS = 100
+
+class RowError:
+    # yielded by the readers for a row that is reported back and not imported
+    def __init__(self, reason):
+        self.reason = reason
+
+def container_entry(cid, weight, unit):
+    if not cid or weight is None or not unit:
+        return SKIPPED
+    try:
+        weight = float(weight)
+    except (TypeError, ValueError):
+        return RowError(f"invalid weight {weight!r} for container {cid}")
+    if not math.isfinite(weight):
+        return RowError(f"invalid weight {weight!r} for container {cid}")
+    if unit not in KNOWN_UNITS:
+        return RowError(f"unknown unit {unit!r} for container {cid}")
+    return {'container_id': cid, 'weight': weight, 'unit': unit}
+
+def json_container_entry(item):
+    if not isinstance(item, dict):
+        return RowError('not a JSON object')
+    unit = item.get('unit') or ''
+    return container_entry(item.get('id'), item.get('weight'), unit.lower() if isinstance(unit, str) else unit)
+
+def iter_json_array(fileobj, chunk_size=JSON_CHUNK_SIZE):
+    # elements of a top-level JSON array, decoded one at a time so only the current chunk is held in memory
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    expect = '['  # '[' -> 'first' -> ('value' -> 'sep')* until ']'
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise ValueError('JSON format must be a list' if expect == '[' else 'Unexpected end of JSON array')
+            buf, pos = fileobj.read(chunk_size), 0
+            eof = not buf
+            continue
+        ch = buf[pos]
+        if expect == '[':
+            if ch != '[':
+                raise ValueError('JSON format must be a list')
+            pos, expect = pos + 1, 'first'
+        elif expect == 'sep':
+            if ch == ']':
+                return
+            if ch != ',':
+                raise ValueError(f"Invalid JSON array: expected ',' or ']' at {ch!r}")
+            pos, expect = pos + 1, 'value'
+        elif expect == 'first' and ch == ']':
+            return
+        else:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"Invalid JSON array: {e.msg}")
+                end = None
+            # wait for the next chunk when the element is cut by the chunk boundary: undecodable, nothing
+            # seen after it yet, or a number that may go on ("2" + ".5")
+            after = end
+            while after is not None and after < len(buf) and buf[after].isspace():
+                after += 1
+            cut = end is None or after == len(buf) or (
+                isinstance(item, (int, float)) and not isinstance(item, bool) and buf[end] in '.eE+-')
+            if cut and not eof:
+                more = fileobj.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield item
+            pos, expect = end, 'sep'
+
+def iter_json_containers(filepath):
+    # one entry per element of the array: a row dict, SKIPPED or RowError
     with open(filepath) as jsonfile:
-            data = json.load(jsonfile)
-            if not isinstance(data, list):
-                return jsonify({'error': 'JSON format must be a list'}), 400
-            for item in data:
-                cid = item.get('id')
-                weight = item.get('weight')
-                unit = item.get('unit', '').lower()
-                if not cid or weight is None or not unit:
-                    continue
-                try:
-                    weight = float(weight)
-                except ValueError:
-                    invalid_weight_field += 1
-                    continue  # Skip invalid weights
-                existing = Container.query.get(cid)
-                if existing:
-                    existing.weight = weight
-                    existing.unit = unit
-                else:
-                    new = Container(container_id=cid, weight=weight, unit=unit)
-                    db.session.add(new)
-                added += 1
+        for item in iter_json_array(jsonfile):
+            yield json_container_entry(item)
+
+def iter_ndjson_containers(filepath):
+    # one entry per non-blank line, each line a JSON object
+    with open(filepath) as ndjsonfile:
+        for line in ndjsonfile:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield RowError('invalid JSON')
+                continue
+            yield json_container_entry(item)
+
+def iter_csv_containers(filepath):
+    # one entry per data line: a row dict, SKIPPED or RowError; csv.reader pulls the file line by line
+    with open(filepath, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        headers = next(reader, None)
+        if not headers or len(headers) < 2:
+            raise ValueError('Invalid CSV headers')
+        unit = headers[1].lower()
+        for row in reader:
+            if len(row) < 2:
+                yield SKIPPED  # malformed row
+                continue
+            yield container_entry(row[0].strip(), row[1], unit)
+
+def container_file_reader(filename):
+    # row generator for a supported container file, None for anything else
+    if filename.endswith('.csv'):
+        return iter_csv_containers
+    if filename.endswith('.json'):
+        return iter_json_containers
+    if filename.endswith(('.ndjson', '.jsonl')):
+        return iter_ndjson_containers
+    return None
+
+def import_container_rows(entries, added=0, invalid_weight_field=0, skip=0, on_chunk=None, errors=None):
+    """
+    Upsert reader entries in chunks of BATCH_SIZE rows, so memory is bounded by the chunk and not the file.
+    skip: entries already imported by an earlier run, by position.
+    on_chunk(position, added, invalid, rows) runs after each chunk with the rows it upserted, every entry up to
+    position being handled.
+    errors: list that collects up to MAX_ROW_ERRORS {'row', 'error'} dicts for rejected rows.
+    """
+    position = 0
+    batch = []
+    for position, entry in enumerate(entries, 1):
+        if position <= skip:
+            continue
+        if isinstance(entry, RowError):
+            invalid_weight_field += 1
+            if errors is not None and len(errors) < MAX_ROW_ERRORS:
+                errors.append({'row': position, 'error': entry.reason})
+        elif entry is not SKIPPED:
+            batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            added += upsert_containers(batch)
+            if on_chunk:
+                on_chunk(position, added, invalid_weight_field, batch)
+            batch = []
+    added += upsert_containers(batch)
+    if on_chunk:
+        on_chunk(max(position, skip), added, invalid_weight_field, batch)
     return added, invalid_weight_field
 
+def handle_json_in_file(filepath, added, invalid_weight_field):
+    return import_container_rows(iter_json_containers(filepath), added, invalid_weight_field)
+
 def handle_csv_in_file(filepath, added, invalid_weight_field):
-    with open(filepath, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            headers = next(reader, None)  
-            if not headers or len(headers) < 2:
-                return jsonify({'error': 'Invalid CSV headers'}), 400
-            unit = headers[1].lower()  
-            for row in reader:
-                if len(row) < 2:
-                    continue  # Skip malformed rows
-                cid = row[0].strip()
-                try:
-                    weight = float(row[1])
-                except ValueError:
-                    invalid_weight_field += 1
-                    continue  # Skip rows with invalid weight
-                if not cid:
-                    continue  # Skip empty container ID
-                existing = Container.query.get(cid)
-                if existing:
-                    existing.weight = weight
-                    existing.unit = unit
-                else:
-                    new = Container(container_id=cid, weight=weight, unit=unit)
-                    db.session.add(new)
-                added += 1
-    return added, invalid_weight_field
+    return import_container_rows(iter_csv_containers(filepath), added, invalid_weight_field)
 
-def get_item_data(date_from, date_to, id):
+def item_time_range(date_from, date_to):
+    # /item defaults: from the start of the month until now
     default_from = datetime.now().replace(day=1, hour=00, minute=00, second=00, microsecond=00)
     default_to = datetime.now()
+    return parse_date(date_string=date_from, default_date=default_from), parse_date(date_string=date_to, default_date=default_to)
 
-    final_from = parse_date(date_string=date_from, default_date=default_from)
-    final_to = parse_date(date_string=date_to, default_date=default_to)
-
-    tara, transctions = find_transactions_by_id_and_time(id=id, start_time=final_from, end_time=final_to)
-    print_debug(f"transactions trucks are {transctions}")
-    container = None
-    if transctions is None:
-        transctions = find_transactions_by_container(container_id=id, start_time=final_from, end_time=final_to)
-        print_debug(f"didn't find trucks.")
-        print_debug(f"transaciotns containers are {transctions}")
-        container = db.session.query(Container).filter(Container.container_id == id).first() if transctions else None
-        print_debug(f"containers are {container}")
-        if container:
-            unit, tara = lb_to_kg(unit=container.unit, weight=container.weight)
-    
-    if transctions is None and container is None:
-        return None
-    
-    session_ids = []
-    
-    for transaction in transctions:
-        session_ids.append(transaction.session_id)
-    
-    list(set(session_ids))
-    for _item in session_ids:
-        if _item is None:
-            session_ids.remove(_item)
-    
-    ret = {"id": id, "tara": tara if tara else 'na', 'sessions': session_ids, 'unit': 'kg'}
-    print_debug(ret)
-
-    return ret
-
-def find_transactions_by_id_and_time(id, start_time, end_time):
-    transactions = db.session.query(Transaction).filter(
+def get_item_data(date_from, date_to, id):
+    final_from, final_to = item_time_range(date_from, date_to)
+    items, _ = find_items([id], final_from, final_to)
+    return items[0] if items else None
+
+def find_items(ids, start_time, end_time):
+    """
+    /item answers for many ids with two grouped queries: ids with truck transactions in the window are trucks
+    (tara = truckTara of their latest out), the rest are looked up as containers (tara from the registry).
+    Returns (items in request order, ids found as neither).
+    """
+    ids = list(dict.fromkeys(ids))
+    found = {}
+    for truck, session_id, direction, truck_tara in item_truck_rows_query(ids, start_time, end_time):
+        item = found.setdefault(truck, {'tara': None, 'sessions': []})
+        item['sessions'].append(session_id)
+        if direction == 'out' and isinstance(truck_tara, int):
+            item['tara'] = truck_tara  # rows come oldest first, so the latest out wins
+
+    containers = [i for i in ids if i not in found]
+    if containers:
+        for cid, session_id in item_container_rows_query(containers, start_time, end_time):
+            found.setdefault(cid, {'tara': None, 'sessions': []})['sessions'].append(session_id)
+        taras = container_taras.get_many([cid for cid in containers if cid in found])
+        for cid, tara in taras.items():
+            found[cid]['tara'] = tara
+
+    items = []
+    for id in ids:
+        if id in found:
+            tara = found[id]['tara']
+            sessions = [s for s in dict.fromkeys(found[id]['sessions']) if s is not None]
+            items.append({"id": id, "tara": tara if tara else 'na', 'sessions': sessions, 'unit': 'kg'})
+    missing = [id for id in ids if id not in found]
+    log.debug("items %s: %s, not found: %s", ids, items, missing)  # formatted only when DEBUG is on
+    return items, missing
+
+# query builders for the hot paths, shared with the check-query-plans command
+def latest_transaction_query(truck):
+    # ids are time-ordered, so they break ties between weighings in the same second
+    return db.session.query(Transaction).filter(Transaction.truck == truck).order_by(Transaction.datetime.desc(), Transaction.id.desc())
+
+def session_transactions_query(session_id):
+    return db.session.query(Transaction).filter(Transaction.session_id == session_id)
+
+def sessions_query(session_ids=None, trucks=None, start_time=None, end_time=None):
+    # every transaction of the given sessions, or of the trucks' sessions in the range, in one indexed query
+    query = db.session.query(Transaction)
+    if session_ids is not None:
+        query = query.filter(Transaction.session_id.in_(session_ids))
+    else:
+        query = query.filter(
+            Transaction.truck.in_(trucks),
+            Transaction.datetime >= start_time,
+            Transaction.datetime <= end_time,
+        )
+    return query.order_by(Transaction.session_id, Transaction.id)
+
+def session_record(tx_list):
+    # the out-record answers for a session when there is one
+    return next((t for t in tx_list if t.direction == 'out'), tx_list[0])
+
+def session_to_dict(tx):
+    result = {
+        'id': tx.id,
+        'truck': tx.truck,
+        'bruto': tx.bruto,
+        'produce': tx.produce
+    }
+    if tx.direction == 'out':
+        result['truckTara'] = tx.truckTara
+        result['neto'] = tx.neto if tx.neto is not None else 'na'
+    return result
+
+def find_sessions(session_ids=None, trucks=None, start_time=None, end_time=None):
+    # one entry per session, shaped like GET /session/<id> plus its session_id and direction
+    grouped = {}
+    for tx in sessions_query(session_ids, trucks, start_time, end_time):
+        grouped.setdefault(tx.session_id, []).append(tx)
+    sessions = []
+    for session_id, tx_list in grouped.items():
+        tx = session_record(tx_list)
+        sessions.append({'session_id': session_id, 'direction': tx.direction, **session_to_dict(tx)})
+    return sessions
+
+def item_truck_rows_query(trucks, start_time, end_time):
+    return db.session.query(
+        Transaction.truck, Transaction.session_id, Transaction.direction, Transaction.truckTara
+    ).filter(
         and_(
+            Transaction.truck.in_(trucks),
             Transaction.datetime >= start_time,
             Transaction.datetime <= end_time,
-            or_(
-                Transaction.truck == id,
-            )
         )
-    ).all()
-
-    if not transactions:
-        return None, None
-
-    latest_out_tara = None
-    for tx in sorted(transactions, key=lambda t: t.datetime, reverse=True):
-        if tx.direction == "out" and isinstance(tx.truckTara, int):
-            latest_out_tara = tx.truckTara
-            break
-
-    return latest_out_tara, transactions
+    ).order_by(Transaction.truck, Transaction.datetime)
 
-def find_transactions_by_container(container_id, start_time, end_time):
-    transactions = db.session.query(Transaction).filter(
+def item_container_rows_query(container_ids, start_time, end_time):
+    return db.session.query(TransactionContainer.container_id, Transaction.session_id).join(
+        Transaction, TransactionContainer.transaction_id == Transaction.id
+    ).filter(
         and_(
+            TransactionContainer.container_id.in_(container_ids),
             Transaction.datetime >= start_time,
             Transaction.datetime <= end_time,
         )
-    ).all()
-
-    matching = []
-    for tx in transactions:
-        try:
-            container_list = json.loads(tx.containers)
-            if container_id in container_list:
-                matching.append(tx)
-        except (TypeError, json.JSONDecodeError):
-            continue  # skip if containers field is invalid
+    ).order_by(Transaction.datetime)
+
+def time_range_filters(model, from_datetime, to_datetime, direction_list):
+    return (
+        model.datetime.between(from_datetime, to_datetime),
+        model.direction.in_(direction_list),
+    )
+
+def unknown_containers_query(from_time=None, to_time=None):
+    # anti-join: containers on transactions in the window with no registered positive weight
+    query = db.session.query(TransactionContainer.container_id).join(
+        Transaction, Transaction.id == TransactionContainer.transaction_id
+    ).outerjoin(
+        Container,
+        and_(Container.container_id == TransactionContainer.container_id, Container.weight >= 1)
+    ).filter(Container.container_id.is_(None))
+    if from_time:
+        query = query.filter(Transaction.datetime >= from_time)
+    if to_time:
+        query = query.filter(Transaction.datetime <= to_time)
+    return query.distinct()
+
+def find_unknown_container_ids(from_time=None, to_time=None, after=None, limit=None):
+    # without a window the materialized unknown_containers set answers directly
+    if from_time or to_time:
+        query = unknown_containers_query(from_time, to_time)
+        column = TransactionContainer.container_id
+    else:
+        query = db.session.query(UnknownContainer.container_id)
+        column = UnknownContainer.container_id
+    if after:
+        query = query.filter(column > after)
+    query = query.order_by(column)
+    if limit:
+        query = query.limit(limit)
+    return [row.container_id for row in query.all()]
+
+def mark_unknown_containers(container_ids):
+    # add the given containers to the materialized set unless they have a positive registered weight;
+    # checked against the registry, not container_taras, whose copy may predate another process's import
+    container_ids = [cid for cid in dict.fromkeys(container_ids or []) if cid]
+    if not container_ids:
+        return
+    candidates = union_all(*[select(literal(cid, String).label('container_id')) for cid in container_ids]).subquery()
+    registered = select(Container.container_id).where(
+        Container.container_id == candidates.c.container_id, Container.weight >= 1
+    )
+    db.session.execute(insert_ignore(db.session, UnknownContainer).from_select(
+        ['container_id'], select(candidates.c.container_id).where(~exists(registered))
+    ))
+
+def refresh_unknown_containers(rows):
+    # called with each uploaded chunk: registered tares leave the set, non-positive ones already seen join it
+    registered = [row['container_id'] for row in rows if row['weight'] >= 1]
+    unregistered = [row['container_id'] for row in rows if row['weight'] < 1]
+    if registered:
+        db.session.query(UnknownContainer).filter(
+            UnknownContainer.container_id.in_(registered)
+        ).delete(synchronize_session=False)
+    if unregistered:
+        seen = db.session.query(TransactionContainer.container_id).filter(
+            TransactionContainer.container_id.in_(unregistered)
+        ).distinct()
+        db.session.execute(
+            insert_ignore(db.session, UnknownContainer).from_select(['container_id'], seen)
+        )
 
-    return matching if matching else None
+def rebuild_unknown_containers():
+    db.session.query(UnknownContainer).delete(synchronize_session=False)
+    db.session.execute(
+        insert(UnknownContainer).from_select(['container_id'], unknown_containers_query())
+    )
+    return db.session.query(UnknownContainer).count()
 
 def transaction_to_dict(transaction):
-    if not isinstance(transaction.datetime, datetime):
-        transaction.datetime = datetime.strptime(transaction.datetime, '%Y%m%d%H%M%S')
+    when = transaction.datetime
+    if isinstance(when, str):  # not yet reloaded from the DB after POST /weight
+        when = datetime.fromisoformat(when)
     return {
         'id': transaction.id,           
-        'datetime': transaction.datetime.isoformat() if transaction.datetime else None,
+        'datetime': when.isoformat() if when else None,
         'direction': transaction.direction,
         'truck': transaction.truck,
         'containers': json.loads(transaction.containers) if transaction.containers else [],
@@ -183,9 +454,22 @@ def transaction_to_dict(transaction):
         'session_id': transaction.session_id,
     }
 
-def create_session_id(transaction_time):
-    time_as_obj = datetime.fromisoformat(transaction_time)
-    return int(time_as_obj.timestamp())
+def find_latest_transaction(truck):
+    # previous record for POST /weight: cache first, one indexed query on a miss
+    cached = latest_transactions.get(truck)
+    if cached is not MISSING:
+        return cached
+    latest = latest_transaction_query(truck).first()
+    latest = transaction_to_dict(latest) if latest else None
+    latest_transactions.set(truck, latest)
+    return latest
+
+def remember_latest(snapshot):
+    # call after the commit; an out-of-order weighing must not replace a newer cached record
+    cached = latest_transactions.get(snapshot['truck'])
+    if cached is not MISSING and cached and cached['datetime'] and snapshot['datetime'] and cached['datetime'] > snapshot['datetime']:
+        return
+    latest_transactions.set(snapshot['truck'], snapshot)
 
 def create_transaction_from_data_and_session_id(data: json, session_id: int):
     new_transaction = Transaction()
@@ -204,19 +488,23 @@ def create_transaction_from_data_and_session_id(data: json, session_id: int):
 def insert_transaction(new_transaction, exists: bool):
     if exists:
         tx = Transaction.query.get(new_transaction.id)
+        rollups.record_transaction(tx, count=0, bruto=(new_transaction.bruto or 0) - (tx.bruto or 0), neto=0)
         tx.bruto = new_transaction.bruto
     else:
+        tx = new_transaction
         db.session.add(new_transaction)
+        link_transaction_containers(new_transaction.id, json.loads(new_transaction.containers))
+        rollups.record_transaction(new_transaction)
+    snapshot = transaction_to_dict(tx)  # before commit expires the attributes
     db.session.commit()
-
-def print_debug(msg: str):
-    print(msg, file=sys.stdout, flush=True)
+    remember_latest(snapshot)
 
 def lb_to_kg(unit, weight):
-    if unit == 'lb' and isinstance(weight, int) :
-        weight_in_kg = int(weight /  2.205)
+    # 'lb'/'lbs' numbers become integer kg, truncated as they always were; anything else (strings included)
+    # is returned untouched
+    if unit in LB_UNITS and isinstance(weight, (int, float)) and not isinstance(weight, bool):
         unit = 'kg'
-        weight = weight_in_kg
+        weight = int(weight / LB_PER_KG)
     return unit, weight
 
 
@@ -227,13 +515,11 @@ def parse_date(date_string, default_date=None):
     try:
         return datetime.strptime(date_string, '%Y%m%d%H%M%S')
     except ValueError:
-        print(f"Invalid date format: {date_string}")
+        log.warning("invalid date format: %s", date_string)
         return default_date
    
 
-# Function to get transactions in a time range
-def get_transactions_by_time_range(db_session,Transaction_model,from_time, to_time, directions=None):  
-    
+def resolve_time_range(from_time, to_time, directions=None):
     # Default values
     now = datetime.now()
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -247,70 +533,103 @@ def get_transactions_by_time_range(db_session,Transaction_model,from_time, to_ti
     if not directions:   #If no direction is specified use all
         directions = "in,out,none"
     direction_list = directions.split(',')
+    return from_datetime, to_datetime, direction_list
+
+def transaction_to_weight_item(t):
+    containers_list = []
+    if t.containers and t.containers != 'na':  # na if some of containers have unknown tara
+        containers_list = t.containers.split(',')
+    
+    return {
+        "id": str(t.session_id),
+        "direction": t.direction,  
+        "truck": t.truck,
+        "bruto": t.bruto,          
+        "neto": t.neto if t.neto is not None else "na",  
+        "produce": t.produce,      
+        "containers": containers_list
+    }
+
+# Function to get transactions in a time range
+def get_transactions_by_time_range(db_session,Transaction_model,from_time, to_time, directions=None):  
+    
+    from_datetime, to_datetime, direction_list = resolve_time_range(from_time, to_time, directions)
     
     try:  # try/except block to handle database errors
 
          
         # Query transactions matching the criteria
         query = db_session.query(Transaction_model).filter(
-            Transaction_model.datetime.between(from_datetime, to_datetime),
-            Transaction_model.direction.in_(direction_list)
+            *time_range_filters(Transaction_model, from_datetime, to_datetime, direction_list)
         ).all()
 
-        #print_debug("PRINT QUERY")
-        #print_debug(query)
-
-        
         # Format results
-        result = []
-        for t in query:
-            containers_list = []
-            if t.containers and t.containers != 'na':  # na if some of containers have unknown tara
-                containers_list = t.containers.split(',')
-            
-            transaction_obj = {
-                "id": str(t.session_id),
-                "direction": t.direction,  
-                "bruto": t.bruto,          
-                "neto": t.neto if t.neto is not None else "na",  
-                "produce": t.produce,      
-                "containers": containers_list
-            }
-            result.append(transaction_obj)   # [
-                                             #     {"id": "101", ..., "containers": ["C001", "C002"]},
-                                             #     {"id": "102", ..., "containers": ["C003"]},
-                                             #     {"id": "103", ..., "containers": []}
-                                             # ] 
+        result = [transaction_to_weight_item(t) for t in query]   # [
+                                                                  #     {"id": "101", ..., "containers": ["C001", "C002"]},
+                                                                  #     {"id": "102", ..., "containers": ["C003"]},
+                                                                  #     {"id": "103", ..., "containers": []}
+                                                                  # ] 
 
         return result
         
 
-    except Exception as e:
-        print(f"Error executing query: {e}")
+    except Exception:
+        log.exception("error executing query")
         return []
+
+# keyset cursor for GET /weight: "<yyyymmddhhmmss>_<transaction id>" of the last row returned
+def encode_weight_cursor(transaction):
+    return f"{transaction.datetime.strftime('%Y%m%d%H%M%S')}_{transaction.id}"
+
+def decode_weight_cursor(cursor):
+    try:
+        when, _id = cursor.split('_', 1)
+        return datetime.strptime(when, '%Y%m%d%H%M%S'), int(_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def ordered_time_range_query(from_time, to_time, directions=None, after=None):
+    from_datetime, to_datetime, direction_list = resolve_time_range(from_time, to_time, directions)
+    query = db.session.query(Transaction).filter(
+        *time_range_filters(Transaction, from_datetime, to_datetime, direction_list)
+    )
+    if after:
+        after_datetime, after_id = decode_weight_cursor(after)
+        query = query.filter(or_(
+            Transaction.datetime > after_datetime,
+            and_(Transaction.datetime == after_datetime, Transaction.id > after_id),
+        ))
+    return query.order_by(Transaction.datetime, Transaction.id)
+
+def get_weight_page(from_time, to_time, directions=None, after=None, limit=100):
+    # one page plus the cursor of its last row, None when the range is exhausted
+    rows = ordered_time_range_query(from_time, to_time, directions, after).limit(limit + 1).all()
+    next_cursor = encode_weight_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [transaction_to_weight_item(t) for t in rows[:limit]], next_cursor
+
+def iter_weight_items(from_time, to_time, directions=None, after=None):
+    # server-side cursor, BATCH_SIZE rows in memory at a time
+    query = ordered_time_range_query(from_time, to_time, directions, after).yield_per(BATCH_SIZE)
+    for t in query:
+        yield transaction_to_weight_item(t)
     
 class truck_direction():
 
 
     def truck_in(data: json):
-        session_id = None
-        already_exists = False
-        try:
-            prev_record = json.loads(data['prev_record'])
-            if prev_record['direction'] == 'in':
-                if not data['force']:
-                    return {'error': 'Two in in a row without an out.'}, 400
-                elif prev_record['truck'] != data['truck']:
-                        return {'error': 'Bad Request'}, 400 # better text, unsure can happen
-                else:
-                    session_id = prev_record['session_id']
-                    already_exists = True
-        except KeyError:
-            session_id = create_session_id(data['datetime'])
-            if id_exists(session_id):
-                return {'error': "ID already exists, can't have two entries at the same second."}, 400
-        data['unit'], data['weight'] = lb_to_kg(data['unit'], data['weight'])
-        data['bruto'] = data['weight']
+        prev_record = data.get('prev_record')
+        if prev_record and prev_record['direction'] == 'in':
+            if not data['force']:
+                return {'error': 'Two in in a row without an out.'}, 400
+            elif prev_record['truck'] != data['truck']:
+                return {'error': 'Bad Request'}, 400 # better text, unsure can happen
+            # forced: overwrite the bruto of the open session
+            session_id = prev_record['session_id']
+            already_exists = True
+        else:
+            session_id = new_transaction_id()
+            already_exists = False
+        data['bruto'] = data['weight']  # already kg, POST /weight normalizes the unit
         new_transaction = create_transaction_from_data_and_session_id(data=data, session_id=session_id)
         insert_transaction(new_transaction=new_transaction, exists=already_exists)
         ret_json = {'id': new_transaction.id, 'truck': new_transaction.truck, 'bruto': new_transaction.bruto}
@@ -319,7 +638,7 @@ class truck_direction():
 
     def truck_out(data: json):
         try:
-            entrance = json.loads(data['prev_record'])
+            entrance = data['prev_record']
         except KeyError:
             return "No in for this out", 400
         if entrance['direction'] == 'out':
@@ -329,27 +648,21 @@ class truck_direction():
                 return {'error': 'Bad Request'}, 400 # better text
         bruto = entrance['bruto']
         truck_tara = data['weight']
-        containers_tara = 0
-        neto = 0
         container_ids = entrance['containers']
-        containers = db.session.query(Container).filter(Container.container_id.in_(container_ids)).all()
-        for container in containers:
-            if isinstance(container.weight, int) and container.weight > 0:
-                container.unit, container.weight = lb_to_kg(container.unit, container.weight)
-                containers_tara += container.weight
-            else:
-                containers_tara = 'na'
-                neto = 'na'
-                break
-        if neto == 0:
-            neto = bruto - truck_tara - containers_tara
-        _id = create_session_id(data['datetime']) #this is also the id - not session id - for out
-        if id_exists(_id):
-            return {'error': "ID already exists, can't have two entries at the same second."}, 400
-        new_transaction = in_json_and_extras_to_transaciotn(in_json=entrance, truck_tara=truck_tara, neto=neto, exact_time=data['datetime'], id=_id)
+        taras = container_taras.get_many(container_ids)
+        if any(tara is None for tara in taras.values()):
+            neto = None  # "na": some container has no known tara
+        else:
+            neto = bruto - truck_tara - sum(taras.values())
+        # the out gets its own id and keeps the session id of its in
+        new_transaction = in_json_and_extras_to_transaciotn(in_json=entrance, truck_tara=truck_tara, neto=neto, exact_time=data['datetime'], id=new_transaction_id())
         db.session.add(new_transaction)
+        link_transaction_containers(new_transaction.id, container_ids)
+        rollups.record_transaction(new_transaction)
+        snapshot = transaction_to_dict(new_transaction)
         db.session.commit()
-        ret = {'id': new_transaction.id, 'truck': new_transaction.truck, 'bruto': new_transaction.bruto, 'truckTara': new_transaction.truckTara, 'neto': new_transaction.neto}
+        remember_latest(snapshot)
+        ret = {'id': new_transaction.id, 'truck': new_transaction.truck, 'bruto': new_transaction.bruto, 'truckTara': new_transaction.truckTara, 'neto': new_transaction.neto if new_transaction.neto is not None else 'na'}
         return ret, 200
     
     def truck_none(data: json):
@@ -357,21 +670,20 @@ class truck_direction():
         new_tansaction = Transaction()
         new_tansaction.bruto = data['weight']
         container_id = data['containers'][0] # אthis implementation of none only accepts single container
-        container = db.session.query(Container).filter_by(container_id=container_id).first()
-        if not container or not container_has_weight_in_table(container_id=container_id):
+        container_tara = container_taras.get(container_id)
+        if container_tara is None:
             return {"error": "Container is not in container database, cannot calculate neto."}, 404
-        unit, container_tara = lb_to_kg(container.unit ,container.weight)
         new_tansaction.truckTara = container_tara #should this be the case?
-        new_tansaction.containers = [container]
+        new_tansaction.containers = json.dumps([container_id])
         new_tansaction.neto = new_tansaction.bruto - container_tara
-        new_tansaction.id = new_tansaction.session_id = create_session_id(data['datetime'])
-        if id_exists(new_tansaction.id):
-            return {'error': "ID already exists, can't have two entries at the same second."}, 400
+        new_tansaction.id = new_tansaction.session_id = new_transaction_id()
         new_tansaction.direction = 'none'
         new_tansaction.produce = data['produce']
         new_tansaction.truck = 'na'
         new_tansaction.datetime = data['datetime']
         db.session.add(new_tansaction)
+        link_transaction_containers(new_tansaction.id, [container_id])
+        rollups.record_transaction(new_tansaction)
         db.session.commit()
         ret = {'id': new_tansaction.id, 'truck': new_tansaction.truck, 'bruto': new_tansaction.bruto, 'truckTara': new_tansaction.truckTara, 'neto': new_tansaction.neto}
         return ret, 200
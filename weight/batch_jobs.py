@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from classes_db import BatchJob, db
+import auxillary_functions
+
+log = logging.getLogger(__name__)
+
+# container files are read from here (the mounted in/ folder unless overridden)
+IN_DIR = os.environ.get('WEIGHT_IN_DIR', 'in')
+# imports running at once; the rest wait in the executor queue
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 2))
+
+# a job whose updated_at has not moved for this long is taken as orphaned by a restart or a dead worker
+STALE_SECONDS = int(os.environ.get('BATCH_STALE_SECONDS', 300))
+
+executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch-import')
+# jobs this process queued that have not started yet; every chunk it commits also touches their updated_at,
+# so a queued job's heartbeat stops only when the process that holds it does
+_waiting = set()
+_waiting_lock = threading.Lock()
+
+
+def count_data_rows(filepath):
+    # line-based formats are counted in one pass over the bytes; a JSON array has no cheap count, so no ETA
+    if not filepath.endswith(('.csv', '.ndjson', '.jsonl')):
+        return None
+    with open(filepath, 'rb') as f:
+        lines = sum(1 for line in f if line.strip())
+    return max(lines - 1, 0) if filepath.endswith('.csv') else lines
+
+
+def submit_job(app, filename):
+    now = datetime.now()
+    # total_rows is counted by the worker, so the 202 never waits on a pass over the file
+    job = BatchJob(id=uuid.uuid4().hex, filename=filename, status='queued', rows_done=0, added=0, invalid=0,
+                   created_at=now, updated_at=now)
+    db.session.add(job)
+    db.session.commit()
+    _enqueue(app, job.id)
+    return job
+
+
+def _enqueue(app, job_id):
+    with _waiting_lock:
+        _waiting.add(job_id)
+    executor.submit(run_job, app, job_id)
+
+
+def _touch_waiting(now):
+    # heartbeat for the jobs still queued in this process, committed with the running job's chunk
+    with _waiting_lock:
+        waiting = list(_waiting)
+    if waiting:
+        db.session.query(BatchJob).filter(BatchJob.id.in_(waiting), BatchJob.status == 'queued').update(
+            {'updated_at': now}, synchronize_session=False)
+
+
+def can_resume(job):
+    # failed jobs, and queued or running jobs whose heartbeat stopped because their process went away
+    if job.status == 'failed':
+        return True
+    if job.status in ('queued', 'running') and job.updated_at is not None:
+        return (datetime.now() - job.updated_at).total_seconds() > STALE_SECONDS
+    return False
+
+
+def resume_job(app, job):
+    # picks up after the last committed chunk
+    job.status = 'queued'
+    job.error = None
+    job.finished_at = None
+    job.updated_at = datetime.now()
+    db.session.commit()
+    _enqueue(app, job.id)
+    return job
+
+
+def run_job(app, job_id):
+    with _waiting_lock:
+        _waiting.discard(job_id)
+    with app.app_context():
+        try:
+            job = db.session.get(BatchJob, job_id)
+            job.status = 'running'
+            job.started_at = job.started_at or datetime.now()
+            if job.total_rows is None:
+                job.total_rows = count_data_rows(os.path.join(IN_DIR, job.filename))
+            job.updated_at = datetime.now()
+            db.session.commit()
+
+            reader = auxillary_functions.container_file_reader(job.filename)
+            errors = json.loads(job.row_errors) if job.row_errors else []
+
+            def on_chunk(position, added, invalid, rows):
+                # the chunk's upserts and the new resume position land in one commit
+                job.rows_done = position
+                job.added = added
+                job.invalid = invalid
+                job.row_errors = json.dumps(errors) if errors else None
+                job.updated_at = datetime.now()
+                _touch_waiting(job.updated_at)
+                db.session.commit()
+                # committed taras go straight into the cache; expiring it would put a registry reload on the
+                # next gate request after every chunk
+                auxillary_functions.container_taras.set_many(auxillary_functions.taras_of(rows))
+
+            auxillary_functions.import_container_rows(reader(os.path.join(IN_DIR, job.filename)),
+                                                      job.added, job.invalid, skip=job.rows_done, on_chunk=on_chunk,
+                                                      errors=errors)
+            job.status = 'done'
+            job.finished_at = job.updated_at = datetime.now()
+            db.session.commit()
+        except Exception as e:
+            log.exception("batch job %s failed", job_id)
+            db.session.rollback()
+            job = db.session.get(BatchJob, job_id)
+            if job is not None:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = job.updated_at = datetime.now()
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def job_to_dict(job):
+    result = {
+        'job_id': job.id,
+        'file': job.filename,
+        'status': job.status,
+        'rows_processed': job.rows_done,
+        'total_rows': job.total_rows,
+        'added': job.added,
+        'invalid': job.invalid,
+        'error': job.error,
+        'row_errors': json.loads(job.row_errors) if job.row_errors else [],
+        'created_at': job.created_at.strftime('%Y%m%d%H%M%S') if job.created_at else None,
+        'finished_at': job.finished_at.strftime('%Y%m%d%H%M%S') if job.finished_at else None,
+        'rows_per_sec': None,
+        'eta_seconds': None,
+    }
+    if job.started_at and job.updated_at:
+        elapsed = (job.updated_at - job.started_at).total_seconds()
+        if elapsed > 0 and job.rows_done:
+            rate = job.rows_done / elapsed
+            result['rows_per_sec'] = int(rate)
+            if job.status == 'running' and job.total_rows is not None:
+                result['eta_seconds'] = round(max(job.total_rows - job.rows_done, 0) / rate, 1)
+    if job.status == 'done':
+        result['eta_seconds'] = 0
+    return result
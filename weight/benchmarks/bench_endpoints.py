@@ -0,0 +1,220 @@
+"""
+Endpoint benchmarks for the weight service, and the billing engine on top of it, at several data sizes.
+
+    python benchmarks/bench_endpoints.py                                 # SQLite stand-in, small and medium
+    python benchmarks/bench_endpoints.py --sizes medium large --database-uri mysql+pymysql://u:p@127.0.0.1/weight_bench
+    python benchmarks/bench_endpoints.py --compare results/old.json results/new.json
+
+Every size starts from an empty database (all weight tables are dropped: point --database-uri at a scratch
+database only) seeded by generate_data. Requests go through Flask's test client, so the timings are app and
+database time without the network. Results are written to benchmarks/results/<commit>.json by default.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEIGHT_DIR = os.path.dirname(HERE)
+sys.path.insert(0, WEIGHT_DIR)
+# after the weight modules: both services have a metrics and a logs module
+sys.path.append(os.path.join(os.path.dirname(WEIGHT_DIR), 'billing', 'flask-in'))
+
+from generate_data import container_ids, generate_containers, generate_transactions, truck_ids, write_files  # noqa: E402
+
+SIZES = {
+    'small': {'trucks': 50, 'containers': 500, 'months': 1},
+    'medium': {'trucks': 200, 'containers': 2000, 'months': 3},
+    'large': {'trucks': 1000, 'containers': 10000, 'months': 12},
+}
+PROVIDER_TRUCKS = 10  # trucks of the provider billed by the sessions_plus_compute_bill case
+REGRESSION_RATIO = 1.2  # --compare flags a p50 this much slower
+
+
+def summarize(samples):
+    samples = sorted(seconds * 1000 for seconds in samples)
+    rank = lambda p: samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]  # noqa: E731
+    return {
+        'n': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(rank(50), 3),
+        'p95_ms': round(rank(95), 3),
+        'p99_ms': round(rank(99), 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def timed(call, repeat):
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        response = call(i)
+        samples.append(time.perf_counter() - started)
+        if response is not None and response.status_code >= 400:
+            raise RuntimeError(f"{response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return summarize(samples)
+
+
+def seed(app, spec, rng, in_dir, end):
+    from sqlalchemy import insert
+    import auxillary_functions
+    import caches
+    from classes_db import Transaction, TransactionContainer, db
+
+    ids = container_ids(spec['containers'])
+    containers = generate_containers(ids, rng)
+    transactions = generate_transactions(truck_ids(spec['trucks']), ids, spec['months'], rng, end=end)
+    write_files(in_dir, containers, transactions)
+
+    batch = auxillary_functions.BATCH_SIZE
+    with app.app_context():
+        for i in range(0, len(transactions), batch):
+            chunk = transactions[i:i + batch]
+            db.session.execute(insert(Transaction), chunk)
+            links = [{'transaction_id': row['id'], 'container_id': cid} for row in chunk for cid in json.loads(row['containers'])]
+            db.session.execute(insert(TransactionContainer), links)
+        registry = [{'container_id': c['id'], 'weight': c['weight'], 'unit': c['unit']} for c in containers]
+        for i in range(0, len(registry), batch):
+            auxillary_functions.upsert_containers(registry[i:i + batch])
+        auxillary_functions.rebuild_unknown_containers()
+        db.session.commit()
+        auxillary_functions.container_taras.load_all()
+    caches.latest_transactions.clear()
+    return transactions
+
+
+def bench_size(spec, database_uri, in_dir, repeat, rng):
+    import api
+    from billing_engine import compute_bill
+    from classes_db import db
+
+    app = api.create_app(database_uri)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    end = datetime.now().replace(microsecond=0)
+    started = time.perf_counter()
+    transactions = seed(app, spec, rng, in_dir, end)
+    seed_seconds = time.perf_counter() - started
+
+    client = app.test_client()
+    stamp = lambda dt: dt.strftime('%Y%m%d%H%M%S')  # noqa: E731
+    month_ago = stamp(end - timedelta(days=30))
+    trucks = truck_ids(spec['trucks'])
+    containers = container_ids(spec['containers'])
+    # /item only answers for ids weighed inside its window
+    recent = [row for row in transactions if row['datetime'] >= end - timedelta(days=30)]
+    recent_trucks = sorted({row['truck'] for row in recent if row['direction'] != 'none'})
+    recent_containers = sorted({cid for row in recent for cid in json.loads(row['containers'])})
+    provider_trucks = rng.sample(trucks, min(PROVIDER_TRUCKS, len(trucks)))
+    produce_rates = {p: rng.randint(1, 5) for p in ('orange', 'tomato', 'mandarin', 'grapefruit', 'apple')}
+    gate_time = end + timedelta(hours=1)  # distinct seconds after the seeded history
+
+    def weigh(direction, i):
+        return client.post('/weight', json={
+            'direction': direction, 'truck': f"BT-{i:05d}", 'containers': [containers[i % len(containers)]],
+            'weight': 15000 if direction == 'in' else 6000, 'unit': 'kg', 'force': False, 'produce': 'orange',
+            'datetime': (gate_time + timedelta(seconds=2 * i + (direction == 'out'))).isoformat(),
+        })
+
+    def batch_import(i):
+        job = client.post('/batch-weight', json={'file': 'containers.csv'}).get_json()
+        while client.get(f"/batch-weight/{job['job_id']}").get_json()['status'] not in ('done', 'failed'):
+            time.sleep(0.005)
+        return None
+
+    def sessions_plus_compute_bill(i):
+        res = client.post('/sessions', json={'trucks': provider_trucks, 'from': month_ago, 'to': stamp(end)})
+        compute_bill(res.get_json()['sessions'], provider_trucks, produce_rates)
+        return res
+
+    cases = {
+        'POST /weight in': lambda i: weigh('in', i),
+        'POST /weight out': lambda i: weigh('out', i),
+        'GET /weight (1 day)': lambda i: client.get('/weight', query_string={'from': stamp(end - timedelta(days=1)), 'to': stamp(end)}),
+        'GET /weight?limit=1000 (30 days)': lambda i: client.get('/weight', query_string={'from': month_ago, 'to': stamp(end), 'limit': 1000}),
+        'GET /item/<truck>': lambda i: client.get(f"/item/{rng.choice(recent_trucks)}", query_string={'from': month_ago}),
+        'GET /item/<container>': lambda i: client.get(f"/item/{rng.choice(recent_containers)}", query_string={'from': month_ago}),
+        'GET /unknown': lambda i: client.get('/unknown'),
+        'POST /batch-weight (whole registry)': batch_import,
+        # not GET /bill/<id>: no billing service or billing DB, so its weight call plus the in-process bill only
+        'sessions_plus_compute_bill': sessions_plus_compute_bill,
+    }
+    results = {}
+    for case, call in cases.items():
+        results[case] = timed(call, max(3, repeat // 10) if 'batch-weight' in case else repeat)
+    return {**spec, 'transactions': len(transactions), 'seed_seconds': round(seed_seconds, 2), 'endpoints': results}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=WEIGHT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(old_path, new_path, ratio=REGRESSION_RATIO):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    regressions = 0
+    print(f"p50 latency, {old['commit']} -> {new['commit']}")
+    for size, result in new['sizes'].items():
+        before = old['sizes'].get(size, {}).get('endpoints', {})
+        for case, stats in result['endpoints'].items():
+            if case not in before:
+                continue
+            change = stats['p50_ms'] / before[case]['p50_ms'] if before[case]['p50_ms'] else 1.0
+            flag = '  REGRESSION' if change > ratio else ''
+            regressions += bool(flag)
+            print(f"  {size:>6} {case:<40} {before[case]['p50_ms']:>9.2f}ms -> {stats['p50_ms']:>9.2f}ms  x{change:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(SIZES))
+    parser.add_argument('--database-uri', help='scratch database; a temporary SQLite file per size by default')
+    parser.add_argument('--repeat', type=int, default=50, help='requests per endpoint')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='results file, benchmarks/results/<commit>.json by default')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files instead')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+
+    workdir = tempfile.mkdtemp(prefix='weight-bench-')
+    os.environ['WEIGHT_IN_DIR'] = workdir  # read by batch_jobs on import, for the /batch-weight case
+    rng = random.Random(args.seed)
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'database': (args.database_uri or 'sqlite').split(':')[0],
+        'repeat': args.repeat,
+        'sizes': {},
+    }
+    for name in args.sizes:
+        uri = args.database_uri or f"sqlite:///{os.path.join(workdir, name + '.db')}"
+        results['sizes'][name] = result = bench_size(SIZES[name], uri, workdir, args.repeat, rng)
+        print(f"{name}: {result['transactions']} transactions, seeded in {result['seed_seconds']}s")
+        for case, stats in result['endpoints'].items():
+            print(f"  {case:<40} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  p99 {stats['p99_ms']:>9.2f}ms")
+
+    output = args.output or os.path.join(HERE, 'results', f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Synthetic weight data in the shape of weight/in/*: N trucks, M containers and K months of in/out/none transactions.
+
+    python benchmarks/generate_data.py --trucks 200 --containers 2000 --months 3 --out /tmp/bench-in
+
+writes containers.csv (kg), containers_lbs.json (lbs) and transactions.ndjson to --out. bench_endpoints.py seeds
+its databases with the same functions.
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+PRODUCE = ('orange', 'tomato', 'mandarin', 'grapefruit', 'apple')
+SESSIONS_PER_TRUCK_MONTH = 20
+UNREGISTERED_SHARE = 0.05  # containers seen on trucks without a registered tara, for /unknown
+NONE_SHARE = 0.02  # standalone container weighings
+
+
+def truck_ids(n):
+    return [f"T-{i:05d}" for i in range(n)]
+
+
+def container_ids(m):
+    return [f"C-{i:06d}" for i in range(m)]
+
+
+def generate_containers(ids, rng):
+    # {'id', 'weight', 'unit'} as in trucks.json; a few containers get no registered tara
+    return [
+        {'id': cid, 'weight': rng.randint(200, 400), 'unit': 'kg'}
+        for cid in ids if rng.random() >= UNREGISTERED_SHARE
+    ]
+
+
+def generate_transactions(trucks, containers, months, rng, end=None, first_id=1):
+    """
+    in/out pairs (plus occasional none weighings) spread over the last `months` months, oldest first,
+    as Transaction column dicts with the container list kept in 'containers' as JSON.
+    """
+    end = end or datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=30 * months)
+    span = int((end - start).total_seconds()) - 3600
+    sessions = []
+    for truck in trucks:
+        truck_tara = rng.randint(5000, 9000)
+        for _ in range(SESSIONS_PER_TRUCK_MONTH * months):
+            sessions.append((start + timedelta(seconds=rng.randrange(span)), truck, truck_tara))
+    sessions.sort()
+
+    rows = []
+    next_id = first_id
+    for when, truck, truck_tara in sessions:
+        if rng.random() < NONE_SHARE:
+            container = rng.choice(containers)
+            rows.append({'id': next_id, 'session_id': next_id, 'datetime': when, 'direction': 'none', 'truck': 'na',
+                         'containers': json.dumps([container]), 'bruto': rng.randint(200, 2000), 'truckTara': None,
+                         'neto': None, 'produce': 'na'})
+            next_id += 1
+            continue
+        on_truck = rng.sample(containers, rng.randint(1, 3))
+        produce = rng.choice(PRODUCE)
+        cargo = rng.randint(2000, 20000)
+        bruto = truck_tara + cargo + 300 * len(on_truck)
+        session_id = next_id
+        rows.append({'id': next_id, 'session_id': session_id, 'datetime': when, 'direction': 'in', 'truck': truck,
+                     'containers': json.dumps(on_truck), 'bruto': bruto, 'truckTara': None, 'neto': None,
+                     'produce': produce})
+        rows.append({'id': next_id + 1, 'session_id': session_id, 'datetime': when + timedelta(minutes=rng.randint(10, 50)),
+                     'direction': 'out', 'truck': truck, 'containers': json.dumps(on_truck), 'bruto': bruto,
+                     'truckTara': truck_tara, 'neto': cargo, 'produce': produce})
+        next_id += 2
+    return rows
+
+
+def write_files(out_dir, containers, transactions):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'containers.csv'), 'w') as f:
+        f.write('"id","kg"\n')
+        for c in containers:
+            f.write(f"{c['id']},{c['weight']}\n")
+    with open(os.path.join(out_dir, 'containers_lbs.json'), 'w') as f:
+        json.dump([{'id': c['id'], 'weight': round(c['weight'] * 2.205), 'unit': 'lbs'} for c in containers], f)
+    with open(os.path.join(out_dir, 'transactions.ndjson'), 'w') as f:
+        for row in transactions:
+            f.write(json.dumps({**row, 'datetime': row['datetime'].isoformat()}) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trucks', type=int, default=200)
+    parser.add_argument('--containers', type=int, default=2000)
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='bench-in')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ids = container_ids(args.containers)
+    containers = generate_containers(ids, rng)
+    transactions = generate_transactions(truck_ids(args.trucks), ids, args.months, rng)
+    write_files(args.out, containers, transactions)
+    print(f"{len(containers)} containers, {len(transactions)} transactions written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Load test for POST /weight: N gates weigh trucks in and out concurrently, each as fast as the service answers.
+
+    python benchmarks/load_post_weight.py --url http://localhost:5000 --gates 20 --trucks 25
+
+Prints p50/p95/p99 latency per direction and the overall throughput. Run it against a staging database:
+every truck it weighs is stored.
+"""
+import argparse
+import json
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]  # nearest rank
+
+
+def run_gate(url, gate, trucks, run_id):
+    session = requests.Session()
+    samples = []
+    for n in range(trucks):
+        truck = f"LT{run_id}-{gate:03d}-{n:04d}"
+        for direction, weight in (("in", 15000), ("out", 5000)):
+            payload = {
+                "direction": direction,
+                "truck": truck,
+                "containers": [],
+                "weight": weight,
+                "unit": "kg",
+                "force": False,
+                "produce": "orange",
+                "datetime": datetime.now().isoformat(timespec="seconds"),  # many weighings share a second
+            }
+            started = time.perf_counter()
+            try:
+                ok = session.post(f"{url}/weight", json=payload, timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            samples.append((direction, time.perf_counter() - started, ok))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--gates", type=int, default=20, help="concurrent gates")
+    parser.add_argument("--trucks", type=int, default=25, help="trucks weighed in and out per gate")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    run_id = random.randrange(10000)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.gates) as pool:
+        runs = pool.map(lambda gate: run_gate(args.url, gate, args.trucks, run_id), range(args.gates))
+        samples = [s for run in runs for s in run]
+    elapsed = time.perf_counter() - started
+
+    results = {"gates": args.gates, "requests": len(samples), "seconds": round(elapsed, 3),
+               "requests_per_sec": round(len(samples) / elapsed, 1), "latency_ms": {}}
+    for direction in ("in", "out", "all"):
+        latencies = [s[1] * 1000 for s in samples if direction in ("all", s[0])]
+        results["latency_ms"][direction] = {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(max(latencies), 2),
+        }
+    results["errors"] = sum(1 for s in samples if not s[2])
+
+    print(f"{results['requests']} requests from {args.gates} gates in {results['seconds']}s "
+          f"({results['requests_per_sec']} req/s, {results['errors']} errors)")
+    for direction, stats in results["latency_ms"].items():
+        print(f"  {direction:>3}: p50 {stats['p50']}ms  p95 {stats['p95']}ms  p99 {stats['p99']}ms  max {stats['max']}ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()  # returned by LRUCache.get on a miss; a cached None is a real value
+
+
+class MemoryBackend:
+    # local stand-in for a shared store (redis or similar): anything with get/set/delete on JSON-able values works
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class LRUCache:
+    """thread-safe in-process LRU, optionally backed by a shared store so several processes see the same values"""
+
+    def __init__(self, capacity, backend=None, namespace=''):
+        self.capacity = capacity
+        self.backend = backend
+        self.namespace = namespace
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _shared_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+        if self.backend is not None:
+            wrapped = self.backend.get(self._shared_key(key))
+            if wrapped is not None:
+                self._store(key, wrapped['value'])
+                with self._lock:
+                    self.hits += 1
+                return wrapped['value']
+        with self._lock:
+            self.misses += 1
+        return MISSING
+
+    def _store(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.backend is not None:
+            self.backend.set(self._shared_key(key), {'value': value})
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(self._shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses}
+
+
+class ContainerTareCache:
+    """
+    container_id -> tara in kg (None when unregistered or without a positive weight).
+    loader(ids) returns that mapping for the given ids, or for every registered container when ids is None.
+    The whole registry is reloaded after ttl seconds or after expire(), by one caller while the others keep serving
+    the old snapshot; /batch-weight writes its chunks in with set_many.
+    """
+
+    def __init__(self, loader, ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self._taras = {}
+        self._loaded_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load_all(self):
+        taras = self.loader(None)
+        with self._lock:
+            self._taras = taras
+            self._loaded_at = time.monotonic()
+
+    def expire(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def set_many(self, taras):
+        # write-through for taras this process just committed; the snapshot's age is unchanged
+        with self._lock:
+            self._taras.update(taras)
+
+    def get_many(self, container_ids):
+        with self._lock:
+            refresh = not self._refreshing and (
+                self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl)
+            self._refreshing = self._refreshing or refresh
+        if refresh:
+            try:
+                self.load_all()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        with self._lock:
+            found = {cid: self._taras[cid] for cid in container_ids if cid in self._taras}
+            missing = [cid for cid in container_ids if cid not in found]
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            # registered by another process since the last load, or unknown: remember either answer
+            loaded = self.loader(missing)
+            loaded = {cid: loaded.get(cid) for cid in missing}
+            with self._lock:
+                self._taras.update(loaded)
+            found.update(loaded)
+        return found
+
+    def get(self, container_id):
+        return self.get_many([container_id])[container_id]
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._taras), 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses}
+
+
+# latest transaction of every truck as a transaction_to_dict snapshot (None = truck has no transactions)
+latest_transactions = LRUCache(int(os.environ.get('TRUCK_CACHE_SIZE', 10000)), namespace='latest')
@@ -1,19 +1,62 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import text, or_, and_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime
 
 db = SQLAlchemy()
 
+
+# dialect-specific inserts: MySQL in production, SQLite as the stand-in database for benchmarks
+def is_sqlite(session):
+    return session.get_bind().dialect.name == 'sqlite'
+
+def upsert(session, model, rows, update):
+    """multi-row INSERT that updates on a primary key clash; update(new) maps columns to expressions over the incoming row"""
+    if is_sqlite(session):
+        stmt = sqlite_insert(model).values(rows)
+        keys = [column.name for column in model.__table__.primary_key]
+        return stmt.on_conflict_do_update(index_elements=keys, set_=update(stmt.excluded))
+    stmt = mysql_insert(model).values(rows)
+    return stmt.on_duplicate_key_update(**update(stmt.inserted))
+
+def insert_ignore(session, model):
+    # INSERT that skips rows whose primary key already exists
+    if is_sqlite(session):
+        return sqlite_insert(model).on_conflict_do_nothing()
+    return mysql_insert(model).prefix_with('IGNORE')
+
+
+class IsoDateTime(db.TypeDecorator):
+    # gates send ISO strings: MySQL parses them on its own, SQLite only takes datetime objects
+    impl = db.DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            return datetime.fromisoformat(value)
+        return value
+
+# transaction ids from ids.py; SQLite keeps INTEGER so the primary key stays its 64-bit rowid
+TransactionId = db.BigInteger().with_variant(db.Integer, 'sqlite')
+
 class Container(db.Model):
     __tablename__ = 'containers_registered'
     container_id = db.Column(db.String(15), primary_key=True)
-    weight = db.Column(db.Integer)
+    weight = db.Column(db.Integer)  # tara in kg, normalized when the registry file is imported
     unit = db.Column(db.String(10))
+    original_weight = db.Column(db.Float)  # as uploaded, before normalization
+    original_unit = db.Column(db.String(10))
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    datetime = db.Column(db.DateTime, default=datetime)
+    __table_args__ = (
+        db.Index('ix_transactions_truck_datetime', 'truck', 'datetime'),  # previous record of a truck, /item/<truck>
+        db.Index('ix_transactions_datetime_direction', 'datetime', 'direction'),  # GET /weight
+        db.Index('ix_transactions_session_id', 'session_id'),  # /session/<id>
+    )
+    id = db.Column(TransactionId, primary_key=True, autoincrement=False)  # from ids.new_transaction_id
+    datetime = db.Column(IsoDateTime, default=datetime)
     direction = db.Column(db.String(10))
     truck = db.Column(db.String(50))
     containers = db.Column(db.String(10000))
@@ -21,4 +64,58 @@ class Transaction(db.Model):
     truckTara = db.Column(db.Integer)
     neto = db.Column(db.Integer)
     produce = db.Column(db.String(50))
-    session_id = db.Column(db.Integer)
\ No newline at end of file
+    session_id = db.Column(TransactionId)  # id of the session's in (or none) transaction
+
+class TransactionContainer(db.Model):
+    # one row per container on a transaction, so container lookups are index joins instead of JSON scans
+    __tablename__ = 'transaction_containers'
+    transaction_id = db.Column(TransactionId, primary_key=True, autoincrement=False)
+    container_id = db.Column(db.String(15), primary_key=True, index=True)
+
+
+class UnknownContainer(db.Model):
+    # materialized answer of /unknown, maintained on transaction writes and /batch-weight uploads
+    __tablename__ = 'unknown_containers'
+    container_id = db.Column(db.String(15), primary_key=True)
+
+
+class WeightRollup(db.Model):
+    # hourly and daily totals per produce/direction/truck, updated in the same commit as each transaction
+    __tablename__ = 'weight_rollups'
+    period = db.Column(db.String(4), primary_key=True)  # 'hour' or 'day'
+    bucket = db.Column(db.DateTime, primary_key=True)  # start of the hour/day
+    produce = db.Column(db.String(50), primary_key=True)
+    direction = db.Column(db.String(10), primary_key=True)
+    truck = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    bruto = db.Column(db.BigInteger, nullable=False, default=0)
+    neto = db.Column(db.BigInteger, nullable=False, default=0)
+    neto_count = db.Column(db.Integer, nullable=False, default=0)  # rows whose neto was known
+
+
+class BatchJob(db.Model):
+    # one /batch-weight import; progress is committed together with each chunk so a failed job resumes where it stopped
+    __tablename__ = 'batch_jobs'
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(10), nullable=False)  # queued, running, done, failed
+    total_rows = db.Column(db.Integer)  # data rows in the file, when cheap to count
+    rows_done = db.Column(db.Integer, nullable=False, default=0)  # entries handled, the resume position
+    added = db.Column(db.Integer, nullable=False, default=0)
+    invalid = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)  # why the job failed
+    row_errors = db.Column(db.Text)  # JSON list of the first rejected rows, {'row', 'error'}
+    created_at = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class IdempotencyKey(db.Model):
+    # POST /weight retries: a key claimed by a running request (no status yet) or the response it got
+    __tablename__ = 'idempotency_keys'
+    idempotency_key = db.Column(db.String(64), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the request body
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)  # JSON body
+    created_at = db.Column(db.DateTime, nullable=False, index=True)  # purge-idempotency-keys
@@ -0,0 +1,191 @@
+import json
+import sys
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import BigInteger, inspect, text
+
+from classes_db import Container, Transaction, TransactionContainer, db, insert_ignore
+import auxillary_functions
+from auxillary_functions import BATCH_SIZE, rebuild_unknown_containers
+import idempotency
+import rollups
+
+# maintenance commands, run with: flask --app api <command>
+
+
+def register_commands(app):
+
+    @app.cli.command('backfill-transaction-containers')
+    def backfill_transaction_containers():
+        """Fill transaction_containers from the containers JSON column of existing transactions."""
+        linked = 0
+        skipped = 0
+        last_id = 0
+        while True:
+            page = db.session.query(Transaction.id, Transaction.containers).filter(
+                Transaction.id > last_id
+            ).order_by(Transaction.id).limit(BATCH_SIZE).all()
+            if not page:
+                break
+            rows = []
+            for tx_id, containers in page:
+                try:
+                    container_ids = json.loads(containers) if containers else []
+                except json.JSONDecodeError:
+                    skipped += 1
+                    continue
+                for cid in dict.fromkeys(container_ids):
+                    if cid:
+                        rows.append({'transaction_id': tx_id, 'container_id': cid})
+            last_id = page[-1].id
+            linked += _insert_links(rows)
+            db.session.commit()
+        click.echo(f"Linked {linked} transaction containers, skipped {skipped} transactions with invalid JSON.")
+
+    @app.cli.command('normalize-container-units')
+    def normalize_container_units():
+        """Convert containers registered before import-time normalization to integer kg, keeping the original value."""
+        normalized = 0
+        skipped = 0
+        last_id = ''
+        while True:
+            page = db.session.query(Container.container_id, Container.weight, Container.unit).filter(
+                Container.container_id > last_id, Container.original_unit.is_(None)
+            ).order_by(Container.container_id).limit(BATCH_SIZE).all()
+            if not page:
+                break
+            rows = []
+            for cid, weight, unit in page:
+                unit = (unit or '').lower()
+                if weight is None or unit not in auxillary_functions.KNOWN_UNITS:
+                    skipped += 1
+                    continue
+                rows.append({'container_id': cid, 'weight': weight, 'unit': unit})
+            last_id = page[-1].container_id
+            normalized += auxillary_functions.upsert_containers(rows)
+            db.session.commit()
+        click.echo(f"Normalized {normalized} containers, skipped {skipped} without a weight or with an unknown unit.")
+
+    @app.cli.command('rebuild-unknown-containers')
+    def rebuild_unknown_containers_command():
+        """Recompute the materialized unknown_containers set from transaction_containers."""
+        count = rebuild_unknown_containers()
+        db.session.commit()
+        click.echo(f"{count} unknown containers.")
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recompute the hourly and daily weight_rollups rows from the full transactions history."""
+        count = rollups.rebuild_rollups()
+        db.session.commit()
+        click.echo(f"{count} rollup rows.")
+
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys():
+        """Delete POST /weight idempotency keys older than IDEMPOTENCY_TTL; run it from cron."""
+        purged = idempotency.purge_expired()
+        click.echo(f"Purged {purged} idempotency keys.")
+
+    @app.cli.command('upgrade-schema')
+    def upgrade_schema():
+        """Move MyISAM tables to InnoDB, widen transaction ids to BIGINT and add missing columns and indexes."""
+        inspector = inspect(db.engine)
+        narrow = narrow_bigint_columns(inspector, db.engine.dialect)
+        for table in db.metadata.sorted_tables:
+            if inspector.has_table(table.name):
+                existing = {c['name'] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    if column.name not in existing:
+                        # new columns are nullable, so existing rows need no backfill here
+                        click.echo(f"{table.name}: add column {column.name}")
+                        db.session.execute(text(f"ALTER TABLE `{table.name}` ADD COLUMN `{column.name}` {column_type}"))
+                    elif (table.name, column.name) in narrow:
+                        # transaction ids outgrew INT (ids.py); this also drops the old AUTO_INCREMENT
+                        click.echo(f"{table.name}: widen {column.name} to BIGINT")
+                        null = '' if column.nullable else ' NOT NULL'
+                        db.session.execute(text(f"ALTER TABLE `{table.name}` MODIFY COLUMN `{column.name}` BIGINT{null}"))
+            engine = db.session.execute(
+                text("SELECT engine FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = :name"),
+                {'name': table.name}
+            ).scalar()
+            if engine and engine.lower() != 'innodb':
+                click.echo(f"{table.name}: {engine} -> InnoDB")
+                db.session.execute(text(f"ALTER TABLE `{table.name}` ENGINE=InnoDB"))
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        db.session.commit()
+        click.echo("Schema is up to date.")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans():
+        """EXPLAIN the hot-path queries and exit non-zero if any of them scans a table without a usable index."""
+        failures = find_full_scans()
+        for name, table in failures:
+            click.echo(f"FULL SCAN: {name} reads `{table}` without an index")
+        if failures:
+            sys.exit(1)
+        click.echo("All hot-path queries use an index.")
+
+
+def narrow_bigint_columns(inspector, dialect):
+    # (table, column) the models declare BIGINT that an existing database still has narrower
+    narrow = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name']: c['type'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if (column.name in existing and column.type.compile(dialect=dialect) == 'BIGINT'
+                    and not isinstance(existing[column.name], BigInteger)):
+                narrow.append((table.name, column.name))
+    return narrow
+
+
+def check_id_columns():
+    """refuse to serve while transaction id columns are still INT: ids.py issues ids past 2**31"""
+    if db.engine.dialect.name != 'mysql':
+        return  # SQLite's INTEGER already holds 64 bits
+    narrow = narrow_bigint_columns(inspect(db.engine), db.engine.dialect)
+    if narrow:
+        columns = ', '.join(f"{table}.{column}" for table, column in narrow)
+        raise RuntimeError(f"{columns} must be BIGINT before the service can write transactions; "
+                           f"run `flask --app api upgrade-schema` first")
+
+
+def hot_queries():
+    # same builders the routes use, with representative arguments
+    now = datetime.now()
+    month_ago = now - timedelta(days=30)
+    return {
+        'POST /weight previous record': auxillary_functions.latest_transaction_query('T-00000').limit(1),
+        'GET /weight': db.session.query(Transaction).filter(
+            *auxillary_functions.time_range_filters(Transaction, month_ago, now, ['in', 'out', 'none'])
+        ),
+        'GET /session/<id>': auxillary_functions.session_transactions_query(1),
+        'POST /sessions ids': auxillary_functions.sessions_query(session_ids=[1, 2, 3]),
+        'POST /sessions trucks': auxillary_functions.sessions_query(trucks=['T-00000', 'T-00001'], start_time=month_ago, end_time=now),
+        'GET|POST /item(s) trucks': auxillary_functions.item_truck_rows_query(['T-00000', 'T-00001'], month_ago, now),
+        'GET|POST /item(s) containers': auxillary_functions.item_container_rows_query(['C-00000', 'C-00001'], month_ago, now),
+        'GET /unknown?from&to': auxillary_functions.unknown_containers_query(month_ago, now),
+    }
+
+
+def find_full_scans():
+    # a plan row with type ALL and no possible_keys is a full scan the optimizer cannot avoid,
+    # while type ALL on a tiny table with a usable index is just the optimizer's choice
+    failures = []
+    for name, query in hot_queries().items():
+        sql = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        for row in db.session.execute(text(f"EXPLAIN {sql}")).mappings():
+            if row['type'] == 'ALL' and not row['possible_keys']:
+                failures.append((name, row['table']))
+    return failures
+
+
+def _insert_links(rows):
+    # INSERT IGNORE keeps the backfill safe to re-run
+    if not rows:
+        return 0
+    db.session.execute(insert_ignore(db.session, TransactionContainer).values(rows))
+    return len(rows)
@@ -0,0 +1,38 @@
+# production serving for the weight service: gunicorn -c gunicorn.conf.py "api:create_app()"
+import os
+
+bind = f"0.0.0.0:{os.environ.get('WEIGHT_PORT', 5000)}"
+
+# one process with a thread per concurrent gate by default: the truck and container caches and the
+# batch-import workers live in the process, so more processes only help once those are shared
+workers = int(os.environ.get('WEB_WORKERS', 1))
+threads = int(os.environ.get('WEB_THREADS', 16))
+worker_class = 'gthread'
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# no preload: create_app starts background threads and loads caches, which must happen in each worker
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+if workers > 1 and 'TRUCK_CACHE_SIZE' not in os.environ:
+    # another worker may have written a truck's latest transaction since this one cached it
+    os.environ['TRUCK_CACHE_SIZE'] = '0'
+
+# transaction ids carry a node id (ids.py), which must differ between live workers: each worker takes the
+# lowest slot no live worker holds, offset by this host's WEIGHT_NODE_ID (give hosts ranges WEB_WORKERS apart)
+node_base = int(os.environ.get('WEIGHT_NODE_ID', 0))
+
+
+def pre_fork(server, worker):
+    taken = {getattr(w, 'node_slot', None) for w in server.WORKERS.values()}
+    worker.node_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    os.environ['WEIGHT_NODE_ID'] = str(node_base + worker.node_slot)
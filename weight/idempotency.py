@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from auxillary_functions import BATCH_SIZE
+from caches import MISSING, LRUCache
+from classes_db import IdempotencyKey, db, insert_ignore
+
+# scale terminals send the same key again when they retry a POST /weight
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+# how long a key's response is replayed; purge-idempotency-keys deletes older rows
+TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+# a claim that has not been answered after this long belongs to a request that died, and may be taken over
+CLAIM_TIMEOUT = int(os.environ.get('IDEMPOTENCY_CLAIM_TIMEOUT', 60))
+
+IN_PROGRESS = {'error': 'A request with this Idempotency-Key is in progress, retry later.'}, 409
+
+# answered keys, so most retries are served without a query
+recent_responses = LRUCache(int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000)), namespace='idempotency')
+
+
+def request_fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _answer(entry, fingerprint):
+    if entry['fingerprint'] != fingerprint:
+        return {'error': 'Idempotency-Key was already used with a different request.'}, 422
+    return json.loads(entry['body']), entry['status'], {'Idempotent-Replayed': 'true'}
+
+
+def _remember(key, fingerprint, body, status, created_at):
+    expires = created_at.timestamp() + TTL_SECONDS
+    recent_responses.set(key, {'fingerprint': fingerprint, 'body': body, 'status': status, 'expires': expires})
+
+
+def claim(key, fingerprint):
+    """
+    None when this request now owns the key and must be processed (then complete() or release() it),
+    otherwise the response to send instead: the stored one, 409 while the first attempt is running, or 422
+    """
+    cached = recent_responses.get(key)
+    if cached is not MISSING and cached['expires'] > time.time():
+        return _answer(cached, fingerprint)
+
+    now = datetime.now()
+    claimed = db.session.execute(
+        insert_ignore(db.session, IdempotencyKey).values(idempotency_key=key, fingerprint=fingerprint, created_at=now)
+    ).rowcount
+    db.session.commit()
+    if claimed:
+        return None
+
+    row = db.session.get(IdempotencyKey, key)
+    if row is None:
+        return IN_PROGRESS  # purged since the insert
+    age = now - row.created_at
+    if age > timedelta(seconds=TTL_SECONDS) or (row.status_code is None and age > timedelta(seconds=CLAIM_TIMEOUT)):
+        # expired, or abandoned by a request that died: take it over, unless another retry just did
+        taken = db.session.query(IdempotencyKey).filter(
+            IdempotencyKey.idempotency_key == key, IdempotencyKey.created_at == row.created_at
+        ).update({'fingerprint': fingerprint, 'created_at': now, 'status_code': None, 'response': None},
+                 synchronize_session=False)
+        db.session.commit()
+        return None if taken else IN_PROGRESS
+    if row.status_code is None:
+        return IN_PROGRESS
+    _remember(key, row.fingerprint, row.response, row.status_code, row.created_at)
+    return _answer({'fingerprint': row.fingerprint, 'body': row.response, 'status': row.status_code}, fingerprint)
+
+
+def complete(key, fingerprint, body, status):
+    # store the answer for retries; server errors are not stored, so a retry runs again
+    if status >= 500:
+        release(key)
+        return
+    stored = json.dumps(body)
+    row = db.session.get(IdempotencyKey, key)
+    if row is None:
+        return  # purged while the request ran
+    row.status_code = status
+    row.response = stored
+    created_at = row.created_at
+    db.session.commit()
+    _remember(key, fingerprint, stored, status, created_at)
+
+
+def release(key):
+    db.session.rollback()
+    db.session.query(IdempotencyKey).filter(IdempotencyKey.idempotency_key == key).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def purge_expired(now=None):
+    # keys older than TTL_SECONDS, BATCH_SIZE at a time so the table is never locked for long
+    cutoff = (now or datetime.now()) - timedelta(seconds=TTL_SECONDS)
+    purged = 0
+    while True:
+        keys = [k for (k,) in db.session.query(IdempotencyKey.idempotency_key).filter(
+            IdempotencyKey.created_at < cutoff).limit(BATCH_SIZE)]
+        if not keys:
+            return purged
+        purged += db.session.query(IdempotencyKey).filter(
+            IdempotencyKey.idempotency_key.in_(keys)).delete(synchronize_session=False)
+        db.session.commit()
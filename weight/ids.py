@@ -0,0 +1,49 @@
+import os
+import threading
+import time
+
+# transaction ids: milliseconds since EPOCH_MS, then the node id, then a sequence within the millisecond.
+# 41 + 6 + 6 bits keeps ids below 2**53, so JavaScript clients read them exactly
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z; ids from before (unix seconds) stay below every new one
+NODE_BITS = 6
+SEQUENCE_BITS = 6
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class IdAllocator:
+    """
+    time-ordered ids that never need a database round trip: processes are kept apart by their node id,
+    ids within one process by the lock and the sequence
+    """
+
+    def __init__(self, node_id, clock=time.time):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"node id must be between 0 and {MAX_NODE_ID}, got {node_id}")
+        self.node_id = node_id
+        self._clock = clock
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            now = int(self._clock() * 1000) - EPOCH_MS
+            if now < self._last_ms:
+                now = self._last_ms  # clock stepped back: keep counting in the last millisecond
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    now += 1  # sequence used up: borrow the next millisecond instead of sleeping
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+
+# one node id per serving process; gunicorn.conf.py gives each worker its own
+allocator = IdAllocator(int(os.environ.get('WEIGHT_NODE_ID', 0)))
+
+
+def new_transaction_id():
+    return allocator.next_id()
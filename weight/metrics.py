@@ -0,0 +1,77 @@
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from sqlalchemy import event
+
+# opt-in: requests slower than this many milliseconds are logged with their slowest SQL statements
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+SLOW_SQL_STATEMENTS = 5
+# statements remembered per request for the slow log
+MAX_TRACKED_STATEMENTS = 1000
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000)
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency until the response starts',
+                            ['method', 'route', 'status'])
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'SQL statements per request', ['method', 'route'],
+                            buckets=QUERY_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('http_request_db_seconds', 'Time spent in SQL per request', ['method', 'route'])
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed, requests and background jobs')
+DB_SECONDS = Counter('db_query_seconds_total', 'Time spent in SQL, requests and background jobs')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    DB_QUERIES.inc()
+    DB_SECONDS.inc(elapsed)
+    if has_request_context():
+        sql = g.setdefault('sql', {'count': 0, 'seconds': 0.0, 'statements': []})
+        sql['count'] += 1
+        sql['seconds'] += elapsed
+        if SLOW_REQUEST_MS and len(sql['statements']) < MAX_TRACKED_STATEMENTS:
+            sql['statements'].append((elapsed, statement))
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_metrics(app, engine):
+    """per-route latency, SQL count and SQL time for every request, exposed on GET /metrics"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = _route()
+        sql = g.get('sql', {'count': 0, 'seconds': 0.0, 'statements': []})
+        REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(request.method, route).observe(sql['count'])
+        REQUEST_SQL_SECONDS.labels(request.method, route).observe(sql['seconds'])
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            slowest = sorted(sql['statements'], key=lambda s: s[0], reverse=True)[:SLOW_SQL_STATEMENTS]
+            app.logger.warning(
+                "slow request %s %s: %.0fms, %d queries, %.0fms in SQL; slowest:%s",
+                request.method, request.full_path.rstrip('?'), elapsed * 1000, sql['count'], sql['seconds'] * 1000,
+                ''.join(f"\n  {seconds * 1000:.1f}ms {' '.join(statement.split())[:500]}" for seconds, statement in slowest),
+            )
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
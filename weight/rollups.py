@@ -0,0 +1,102 @@
+from datetime import datetime
+from sqlalchemy import func, text
+
+from classes_db import WeightRollup, db, upsert
+
+PERIODS = ('hour', 'day')
+GROUP_COLUMNS = ('produce', 'direction', 'truck', 'bucket')
+MISSING = 'na'  # key value for a NULL produce/direction/truck
+
+
+def bucket_of(period, when):
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when)
+    if period == 'hour':
+        return when.replace(minute=0, second=0, microsecond=0)
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def record_transaction(tx, count=1, bruto=None, neto=None):
+    """
+    add a transaction to its hour and day rollup rows; call before the commit that writes it.
+    count/bruto/neto override the increments, e.g. count=0 and a bruto delta when a forced in is re-weighed
+    """
+    if tx.datetime is None:
+        return
+    if bruto is None:
+        bruto = tx.bruto or 0
+    if neto is None:
+        neto = tx.neto if isinstance(tx.neto, int) else None
+    rows = [{
+        'period': period,
+        'bucket': bucket_of(period, tx.datetime),
+        'produce': tx.produce or MISSING,
+        'direction': tx.direction or MISSING,
+        'truck': tx.truck or MISSING,
+        'count': count,
+        'bruto': bruto,
+        'neto': neto or 0,
+        'neto_count': count if neto is not None else 0,
+    } for period in PERIODS]
+    stmt = upsert(db.session, WeightRollup, rows, lambda new: {
+        'count': WeightRollup.count + new.count,
+        'bruto': WeightRollup.bruto + new.bruto,
+        'neto': WeightRollup.neto + new.neto,
+        'neto_count': WeightRollup.neto_count + new.neto_count,
+    })
+    db.session.execute(stmt)
+
+
+# bucket expressions for the backfill, MySQL syntax
+_BUCKET_SQL = {
+    'hour': "DATE_FORMAT(datetime, '%Y-%m-%d %H:00:00')",
+    'day': "DATE(datetime)",
+}
+
+
+def rebuild_rollups():
+    """recompute every rollup row from transactions with one grouped INSERT ... SELECT per period"""
+    db.session.query(WeightRollup).delete(synchronize_session=False)
+    for period, bucket in _BUCKET_SQL.items():
+        db.session.execute(text(f"""
+            INSERT INTO weight_rollups (period, bucket, produce, direction, truck, count, bruto, neto, neto_count)
+            SELECT :period, {bucket}, COALESCE(produce, :missing), COALESCE(direction, :missing), COALESCE(truck, :missing),
+                   COUNT(*), COALESCE(SUM(bruto), 0), COALESCE(SUM(neto), 0), COUNT(neto)
+            FROM transactions
+            WHERE datetime IS NOT NULL
+            GROUP BY 2, 3, 4, 5
+        """), {'period': period, 'missing': MISSING})
+    return db.session.query(WeightRollup).count()
+
+
+def query_stats(period, from_time, to_time, group_by, directions=None):
+    """sum the rollup rows of a period between two datetimes, grouped by any of GROUP_COLUMNS"""
+    columns = [getattr(WeightRollup, name) for name in group_by]
+    query = db.session.query(
+        *columns,
+        func.sum(WeightRollup.count).label('count'),
+        func.sum(WeightRollup.bruto).label('bruto'),
+        func.sum(WeightRollup.neto).label('neto'),
+        func.sum(WeightRollup.neto_count).label('neto_count'),
+    ).filter(
+        WeightRollup.period == period,
+        WeightRollup.bucket.between(bucket_of(period, from_time), to_time),
+    )
+    if directions:
+        query = query.filter(WeightRollup.direction.in_(directions))
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+
+    result = []
+    for row in query.all():
+        item = {name: getattr(row, name) for name in group_by}
+        if 'bucket' in item:
+            item['bucket'] = item['bucket'].strftime('%Y%m%d%H%M%S')
+        item.update({
+            'count': int(row.count or 0),
+            'bruto': int(row.bruto or 0),
+            'neto': int(row.neto or 0),
+            'netoCount': int(row.neto_count or 0),
+        })
+        result.append(item)
+    return result
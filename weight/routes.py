@@ -1,12 +1,16 @@
 import json
-from flask import Flask, request, jsonify,render_template
+from flask import Flask, request, jsonify,render_template, Response, stream_with_context, current_app
 import os
 from sqlalchemy import text
 import csv
+from datetime import datetime
 
-from classes_db import Container, Transaction, db
+from classes_db import BatchJob, Container, Transaction, db
 import auxillary_functions
-from auxillary_functions import print_debug
+import rollups
+import caches
+import batch_jobs
+import idempotency
 
 def register_routes(app):
    
@@ -16,21 +20,36 @@ def register_routes(app):
 
     @app.route('/session/<int:session_id>', methods=['GET'])
     def get_session(session_id):
-        auxillary_functions.print_debug("Entered route func")
-        tx_list = Transaction.query.filter_by(session_id=session_id).all()
+        tx_list = auxillary_functions.session_transactions_query(session_id).all()
         if not tx_list:
             return jsonify({'error': 'Not found'}), 404
-        tx = next((t for t in tx_list if t.direction == 'out'), tx_list[0])
-        result = {
-            'id': tx.id,
-            'truck': tx.truck,
-            'bruto': tx.bruto,
-            'produce': tx.produce
-        }
-        if tx.direction == 'out':
-            result['truckTara'] = tx.truckTara
-            result['neto'] = tx.neto if tx.neto is not None else 'na'
-        return jsonify(result)
+        tx = auxillary_functions.session_record(tx_list)
+        return jsonify(auxillary_functions.session_to_dict(tx))
+
+    # many sessions in one call: {"ids": [...]} or {"trucks": [...], "from": ..., "to": ...}
+    @app.route('/sessions', methods=['POST'])
+    def post_sessions():
+        body = request.get_json(silent=True) or {}
+        ids = body.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or len(ids) > auxillary_functions.MAX_PAGE_SIZE:
+                return jsonify({'error': f"ids must be a list of at most {auxillary_functions.MAX_PAGE_SIZE} session ids"}), 400
+            try:
+                ids = list(dict.fromkeys(int(i) for i in ids))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Session ids must be integers'}), 400
+            sessions = auxillary_functions.find_sessions(session_ids=ids) if ids else []
+            found = {s['session_id'] for s in sessions}
+            return jsonify({'sessions': sessions, 'missing': [i for i in ids if i not in found]})
+
+        trucks = body.get('trucks')
+        if not isinstance(trucks, list) or not trucks:
+            return jsonify({'error': 'Provide ids, or trucks with an optional from/to'}), 400
+        if len(trucks) > auxillary_functions.MAX_PAGE_SIZE:
+            return jsonify({'error': f"At most {auxillary_functions.MAX_PAGE_SIZE} trucks per request"}), 400
+        from_time, to_time, _ = auxillary_functions.resolve_time_range(body.get('from'), body.get('to'))
+        sessions = auxillary_functions.find_sessions(trucks=[str(t) for t in trucks], start_time=from_time, end_time=to_time)
+        return jsonify({'sessions': sessions})
 
     @app.route('/db-check', methods=['GET'])
     def db_check():
@@ -47,12 +66,29 @@ def register_routes(app):
     @app.route('/weight', methods=['POST'])
     def post_weight():
         data = request.get_json()
+        key = request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+        if key is None:
+            return record_weighing(data)
+        if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+            return {'error': f"Idempotency-Key must be 1 to {idempotency.MAX_KEY_LENGTH} characters."}, 400
 
+        # a retry gets the stored response and never reaches the transaction logic
+        fingerprint = idempotency.request_fingerprint(data)
+        replay = idempotency.claim(key, fingerprint)
+        if replay is not None:
+            return replay
+        try:
+            body, status = record_weighing(data)
+        except Exception:
+            idempotency.release(key)
+            raise
+        idempotency.complete(key, fingerprint, body, status)
+        return body, status
+
+    def record_weighing(data):
         if not data['direction'] == 'none':
-            prev_record = db.session.query(Transaction).filter(Transaction.truck == data.get('truck')).order_by(Transaction.datetime.desc()).first()
+            prev_record = auxillary_functions.find_latest_transaction(data.get('truck'))
             if prev_record:
-                prev_record = auxillary_functions.transaction_to_dict(prev_record)
-                prev_record = json.dumps(prev_record)
                 data['prev_record'] = prev_record
         data['unit'], data['weight'] = auxillary_functions.lb_to_kg(data.get('unit'), data.get('weight'))
         
@@ -64,24 +100,41 @@ def register_routes(app):
         filename = request.json.get('file')
         if not filename:
             return jsonify({'error': 'Missing file parameter'}), 400
-        filepath = os.path.join('in', filename)
+        filepath = os.path.join(batch_jobs.IN_DIR, filename)
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 400
-        added = 0 
-        invalid_weight_field = 0
-        try:
-            if filename.endswith('.csv'):
-                added, invalid_weight_field = auxillary_functions.handle_csv_in_file(filepath, added, invalid_weight_field)
-            elif filename.endswith('.json'):
-                added, invalid_weight_field = auxillary_functions.handle_json_in_file(filepath, added, invalid_weight_field)
-            else:
-                return jsonify({'error': 'Unsupported file format'}), 400
-            db.session.commit()
-            msg =  f"Added {added}."
-            msg_invalid = f"Added {added}, didn't upload {invalid_weight_field} due to invalid weight field."
-            return jsonify({'status': 'ok', 'added': msg if invalid_weight_field == 0 else msg_invalid })
-        except Exception as e:
-            return jsonify({'error': 'An error occurred', 'details': str(e)}), 500
+        if auxillary_functions.container_file_reader(filename) is None:
+            return jsonify({'error': 'Unsupported file format'}), 400
+        # the import runs on a background worker and commits in chunks; poll the job for progress
+        job = batch_jobs.submit_job(current_app._get_current_object(), filename)
+        response = jsonify({'status': 'queued', 'job_id': job.id, 'url': f"/batch-weight/{job.id}"})
+        response.headers['Location'] = f"/batch-weight/{job.id}"
+        return response, 202
+
+    @app.route("/batch-weight/<job_id>", methods=["GET"])
+    def get_batch_job(job_id):
+        job = db.session.get(BatchJob, job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(batch_jobs.job_to_dict(job))
+
+    @app.route("/batch-weight/<job_id>/resume", methods=["POST"])
+    def resume_batch_job(job_id):
+        job = db.session.get(BatchJob, job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if not batch_jobs.can_resume(job):
+            return jsonify({'error': f"Job is {job.status}"}), 409
+        batch_jobs.resume_job(current_app._get_current_object(), job)
+        return jsonify(batch_jobs.job_to_dict(job)), 202
+
+    # cache sizes and hit/miss counters
+    @app.route("/caches", methods=["GET"])
+    def get_caches():
+        return jsonify({
+            "container_taras": auxillary_functions.container_taras.stats(),
+            "latest_transactions": caches.latest_transactions.stats(),
+        })
 
     # only for show containers db in html
     @app.route("/containers", methods=["GET"])
@@ -102,19 +155,20 @@ def register_routes(app):
     
     @app.route("/unknown", methods=["GET"])  
     def get_unknown():
-        unknown = Transaction.query.all()  
-        ids = set()  
-        for tx in unknown:  
-            try:
-                if tx.containers and tx.containers != "":
-                    for cid in json.loads(tx.containers):  
-                        if (cid and not Container.query.get(cid)) or not auxillary_functions.container_has_weight_in_table(cid):
-                            ids.add(cid)
-            except json.JSONDecodeError:
-                print(f"Invalid JSON in tx.containers (tx id {tx.id}):", tx.containers)
-                continue
-  
-        return jsonify(list(ids))  
+        from_time = auxillary_functions.parse_date(request.args.get('from'))
+        to_time = auxillary_functions.parse_date(request.args.get('to'))
+        cursor = request.args.get('cursor')
+        try:
+            limit = int(request.args.get('limit', 0))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        limit = min(limit, auxillary_functions.MAX_PAGE_SIZE) if limit > 0 else None
+
+        ids = auxillary_functions.find_unknown_container_ids(from_time=from_time, to_time=to_time, after=cursor, limit=limit)
+        response = jsonify(ids)
+        if limit and len(ids) == limit:
+            response.headers['X-Next-Cursor'] = ids[-1]
+        return response  
     
     # only for show transactions db in html
     @app.route("/transactions", methods=["GET"])
@@ -148,10 +202,64 @@ def register_routes(app):
         to_time = request.args.get('to')
         filter_directions = request.args.get('filter')
 
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+        stream = request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+        try:
+            if stream:
+                # one JSON object per line from a server-side cursor, constant memory for any range
+                if cursor:
+                    auxillary_functions.decode_weight_cursor(cursor)  # reject a bad cursor before the response starts
+                items = auxillary_functions.iter_weight_items(from_time, to_time, filter_directions, after=cursor)
+                lines = (json.dumps(item) + '\n' for item in items)
+                return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+            if limit or cursor:
+                limit = min(int(limit or 100), auxillary_functions.MAX_PAGE_SIZE)
+                if limit < 1:
+                    raise ValueError('limit must be positive')
+                transactions, next_cursor = auxillary_functions.get_weight_page(from_time, to_time, filter_directions, after=cursor, limit=limit)
+                response = jsonify(transactions)
+                if next_cursor:
+                    response.headers['X-Next-Cursor'] = next_cursor
+                return response
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         transactions = auxillary_functions.get_transactions_by_time_range(db.session,Transaction,from_time, to_time, filter_directions)
 
         return jsonify(transactions)
 
+    @app.route('/stats', methods=['GET'])
+    def get_stats():
+        # throughput from the hourly/daily rollups: ?from&to&period=day|hour&group=produce,direction,truck,bucket&filter=in,out
+        period = request.args.get('period', 'day')
+        if period not in rollups.PERIODS:
+            return jsonify({'error': f'period must be one of {list(rollups.PERIODS)}'}), 400
+        group_by = [g for g in request.args.get('group', 'produce').split(',') if g]
+        if any(g not in rollups.GROUP_COLUMNS for g in group_by):
+            return jsonify({'error': f'group must be a subset of {list(rollups.GROUP_COLUMNS)}'}), 400
+        default_from = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        from_time = auxillary_functions.parse_date(request.args.get('from'), default_from)
+        to_time = auxillary_functions.parse_date(request.args.get('to'), datetime.now())
+        directions = request.args.get('filter')
+        directions = directions.split(',') if directions else None
+
+        stats = rollups.query_stats(period, from_time, to_time, group_by, directions)
+        return jsonify(stats)
+
+    # many items in one call: {"ids": [...], "from": ..., "to": ...}, each answered like GET /item/<id>
+    @app.route('/items', methods=['POST'])
+    def post_items():
+        body = request.get_json(silent=True) or {}
+        ids = body.get('ids')
+        if not isinstance(ids, list) or not ids or len(ids) > auxillary_functions.MAX_PAGE_SIZE:
+            return jsonify({'error': f"ids must be a list of 1 to {auxillary_functions.MAX_PAGE_SIZE} truck or container ids"}), 400
+        from_time, to_time = auxillary_functions.item_time_range(body.get('from'), body.get('to'))
+        items, missing = auxillary_functions.find_items([str(i) for i in ids], from_time, to_time)
+        return jsonify({'items': items, 'missing': missing})
+
     @app.route('/item/<id>', methods=['GET'])
     def get_item(id):
         from_date = request.args.get('from')
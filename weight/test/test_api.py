@@ -1,7 +1,9 @@
 
 import pytest
 import requests
+import time
 import datetime
+import json
 import os
 host = os.environ.get('TEST_HOST', 'localhost')
 BASE_URL = f"http://{host}:5000"
@@ -42,6 +44,38 @@ def test_get_weight_default():
             assert isinstance(cid, str)
 
 
+def test_get_weight_paginated_matches_full_list():
+    params = {"from": "20000101000000"}
+    full = requests.get(f"{BASE_URL}/weight", params=params).json()
+    paged = []
+    cursor = None
+    while True:
+        page_params = dict(params, limit=50, **({"cursor": cursor} if cursor else {}))
+        response = requests.get(f"{BASE_URL}/weight", params=page_params)
+        assert response.status_code == 200
+        paged.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(paged) == len(full)
+
+
+def test_get_weight_ndjson_stream():
+    response = requests.get(f"{BASE_URL}/weight", params={"format": "ndjson"}, stream=True)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("application/x-ndjson")
+    for line in response.iter_lines():
+        assert "direction" in json.loads(line)
+
+
+def test_get_stats_by_produce():
+    response = requests.get(f"{BASE_URL}/stats", params={"from": "20000101000000", "group": "produce,direction"})
+    assert response.status_code == 200
+    for row in response.json():
+        assert {"produce", "direction", "count", "bruto", "neto"} <= set(row)
+        assert isinstance(row["count"], int)
+
+
 def test_get_unknown_containers():
     response = requests.get(f"{BASE_URL}/unknown")
     assert response.status_code == 200
@@ -49,6 +83,17 @@ def test_get_unknown_containers():
     for item in response.json():
         assert isinstance(item, str)
 
+def test_get_unknown_containers_paginated():
+    response = requests.get(f"{BASE_URL}/unknown", params={"limit": 1})
+    assert response.status_code == 200
+    page = response.json()
+    assert isinstance(page, list)
+    assert len(page) <= 1
+    cursor = response.headers.get("X-Next-Cursor")
+    if cursor:
+        next_page = requests.get(f"{BASE_URL}/unknown", params={"limit": 1, "cursor": cursor}).json()
+        assert cursor not in next_page
+
 # def test_post_batch_weight_csv():
 #     payload = {
 #         "file": "containers2.csv"
@@ -62,6 +107,18 @@ def test_get_unknown_containers():
 
 #     print(response.status_code, response.text)
 #     assert response.status_code in (200, 201)
+def test_post_batch_weight_runs_as_job():
+    response = requests.post(f"{BASE_URL}/batch-weight", json={"file": "containers2.csv"})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    for _ in range(50):
+        job = requests.get(f"{BASE_URL}/batch-weight/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+    assert job["status"] == "done"
+    assert job["rows_processed"] == job["total_rows"]
+
 def test_post_batch_weight_csv_file_not_found():
     payload = {
         "file": "nonexistent.csv"
@@ -89,6 +146,24 @@ def test_get_session_by_id():
         assert "id" in data
         assert "bruto" in data
 
+def test_post_sessions_bulk():
+    response = requests.post(f"{BASE_URL}/sessions", json={"ids": [0]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["missing"] == [0]
+    response = requests.post(f"{BASE_URL}/sessions", json={"trucks": ["T-00000"], "from": "20000101000000"})
+    assert response.status_code == 200
+    assert isinstance(response.json()["sessions"], list)
+    assert requests.post(f"{BASE_URL}/sessions", json={}).status_code == 400
+
+def test_post_items_bulk():
+    response = requests.post(f"{BASE_URL}/items", json={"ids": ["no-such-item"], "from": "20000101000000"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["items"] == []
+    assert data["missing"] == ["no-such-item"]
+    assert requests.post(f"{BASE_URL}/items", json={"ids": []}).status_code == 400
+
 def test_weight_post():
     payload = {
         "direction": "in",
@@ -0,0 +1,120 @@
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import caches
+from caches import ContainerTareCache, LRUCache, MemoryBackend, MISSING
+
+
+# Test that the least recently used key is evicted first
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+# Test that a cached None is a hit, not a miss
+def test_lru_caches_none():
+    cache = LRUCache(2)
+    cache.set('truck', None)
+    assert cache.get('truck') is None
+    assert cache.stats()['hits'] == 1
+
+# Test that two processes sharing a backend see each other's writes
+def test_lru_reads_through_shared_backend():
+    backend = MemoryBackend()
+    first = LRUCache(10, backend=backend, namespace='latest')
+    second = LRUCache(10, backend=backend, namespace='latest')
+    first.set('T1', {'direction': 'in'})
+    assert second.get('T1') == {'direction': 'in'}
+    first.invalidate('T1')
+    second.clear()
+    assert second.get('T1') is MISSING
+
+
+class RegistryLoader:
+    # loader(ids) over a dict standing in for containers_registered, recording every call
+    def __init__(self, registry):
+        self.registry = registry
+        self.calls = []
+
+    def __call__(self, ids):
+        self.calls.append(ids)
+        if ids is None:
+            return dict(self.registry)
+        return {cid: self.registry[cid] for cid in ids if cid in self.registry}
+
+# Test that load_all answers get_many from memory
+def test_tare_cache_load_all_serves_get_many():
+    loader = RegistryLoader({'C1': 300, 'C2': None})
+    cache = ContainerTareCache(loader, ttl=300)
+    cache.load_all()
+    assert cache.get_many(['C1', 'C2']) == {'C1': 300, 'C2': None}
+    assert loader.calls == [None]
+    assert cache.stats()['hits'] == 2
+
+# Test that an unknown id is looked up once and then remembered as None
+def test_tare_cache_remembers_negative_lookups():
+    loader = RegistryLoader({'C1': 300})
+    cache = ContainerTareCache(loader, ttl=300)
+    cache.load_all()
+    assert cache.get('X') is None
+    assert cache.get('X') is None
+    assert loader.calls == [None, ['X']]
+
+# Test that the registry is reloaded once the ttl has passed, and after expire()
+def test_tare_cache_reloads_after_ttl_and_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caches.time, 'monotonic', lambda: now[0])
+    loader = RegistryLoader({'C1': 300})
+    cache = ContainerTareCache(loader, ttl=300)
+    cache.load_all()
+    loader.registry['C1'] = 250
+    now[0] += 299
+    assert cache.get('C1') == 300
+    now[0] += 2
+    assert cache.get('C1') == 250
+    loader.registry['C1'] = 200
+    cache.expire()
+    assert cache.get('C1') == 200
+    assert loader.calls == [None, None, None]
+
+# Test that set_many writes taras through without a reload
+def test_tare_cache_set_many_writes_through():
+    loader = RegistryLoader({'C1': 300})
+    cache = ContainerTareCache(loader, ttl=300)
+    cache.load_all()
+    cache.get('C2')
+    cache.set_many({'C2': 280, 'C3': None})
+    assert cache.get_many(['C1', 'C2', 'C3']) == {'C1': 300, 'C2': 280, 'C3': None}
+    assert loader.calls == [None, ['C2']]
+
+# Test that only one caller reloads an expired registry while the others are served the old snapshot
+def test_tare_cache_reload_is_single_flight(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caches.time, 'monotonic', lambda: now[0])
+    loader = RegistryLoader({'C1': 300})
+    cache = ContainerTareCache(loader, ttl=300)
+    cache.load_all()
+    loader.registry['C1'] = 250
+    now[0] += 301
+
+    started, release = threading.Event(), threading.Event()
+    def slow_loader(ids):
+        if ids is None:
+            started.set()
+            release.wait(5)
+        return loader(ids)
+    cache.loader = slow_loader
+    refresher = threading.Thread(target=cache.get, args=('C1',))
+    refresher.start()
+    assert started.wait(5)
+    assert [cache.get('C1') for _ in range(3)] == [300, 300, 300]
+    release.set()
+    refresher.join()
+    assert cache.get('C1') == 250
+    assert loader.calls == [None, None]
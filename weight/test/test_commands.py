@@ -0,0 +1,44 @@
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from sqlalchemy import BIGINT, INTEGER
+from sqlalchemy.dialects import mysql
+from classes_db import db
+import commands
+
+
+class FakeInspector:
+    # the columns an existing database reports, {table: {column: type}}
+    def __init__(self, tables):
+        self.tables = tables
+
+    def has_table(self, name):
+        return name in self.tables
+
+    def get_columns(self, name):
+        return [{'name': column, 'type': column_type} for column, column_type in self.tables[name].items()]
+
+
+# database created before transaction ids outgrew INT
+OLD_SCHEMA = {
+    'transactions': {'id': INTEGER(), 'session_id': INTEGER(), 'bruto': INTEGER()},
+    'transaction_containers': {'transaction_id': INTEGER(), 'container_id': mysql.VARCHAR(15)},
+}
+
+
+# Test that only the columns the models declare BIGINT are reported, for tables that exist
+def test_narrow_bigint_columns_finds_int_id_columns():
+    narrow = commands.narrow_bigint_columns(FakeInspector(OLD_SCHEMA), mysql.dialect())
+    assert sorted(narrow) == [('transaction_containers', 'transaction_id'), ('transactions', 'id'),
+                              ('transactions', 'session_id')]
+    widened = {table: {column: BIGINT() for column in columns} for table, columns in OLD_SCHEMA.items()}
+    assert commands.narrow_bigint_columns(FakeInspector(widened), mysql.dialect()) == []
+
+# Test that the service refuses to start on MySQL while an id column is INT, and names the fix
+def test_check_id_columns_refuses_int_ids(monkeypatch):
+    monkeypatch.setattr(commands, 'db', SimpleNamespace(metadata=db.metadata, engine=SimpleNamespace(dialect=mysql.dialect())))
+    monkeypatch.setattr(commands, 'inspect', lambda engine: FakeInspector(OLD_SCHEMA))
+    with pytest.raises(RuntimeError, match='transactions.id.*upgrade-schema'):
+        commands.check_id_columns()
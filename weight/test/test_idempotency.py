@@ -0,0 +1,61 @@
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from flask import Flask
+from classes_db import IdempotencyKey, db
+import idempotency
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        idempotency.recent_responses.clear()
+        yield app
+
+
+# Test that a retry gets the stored response without running again
+def test_retry_replays_stored_response(app):
+    fingerprint = idempotency.request_fingerprint({'truck': 'T1', 'weight': 15000})
+    assert idempotency.claim('gate-1:42', fingerprint) is None
+    idempotency.complete('gate-1:42', fingerprint, {'id': 7, 'truck': 'T1'}, 200)
+
+    assert idempotency.claim('gate-1:42', fingerprint)[:2] == ({'id': 7, 'truck': 'T1'}, 200)
+    idempotency.recent_responses.clear()  # another process: answered from the table
+    assert idempotency.claim('gate-1:42', fingerprint)[:2] == ({'id': 7, 'truck': 'T1'}, 200)
+
+# Test that a retry while the first attempt runs gets 409, and a reused key with another body 422
+def test_in_progress_and_mismatched_requests(app):
+    first = idempotency.request_fingerprint({'truck': 'T1'})
+    assert idempotency.claim('k', first) is None
+    assert idempotency.claim('k', first)[1] == 409
+    idempotency.complete('k', first, {'id': 1}, 200)
+    assert idempotency.claim('k', idempotency.request_fingerprint({'truck': 'T2'}))[1] == 422
+
+# Test that server errors are not stored and abandoned claims can be taken over
+def test_failed_and_abandoned_claims_run_again(app):
+    fingerprint = idempotency.request_fingerprint({'truck': 'T1'})
+    assert idempotency.claim('k', fingerprint) is None
+    idempotency.complete('k', fingerprint, {'error': 'boom'}, 500)
+    assert idempotency.claim('k', fingerprint) is None
+
+    row = db.session.get(IdempotencyKey, 'k')
+    row.created_at = datetime.now() - timedelta(seconds=idempotency.CLAIM_TIMEOUT + 1)
+    db.session.commit()
+    assert idempotency.claim('k', fingerprint) is None
+
+# Test that only keys older than the TTL are purged
+def test_purge_expired(app):
+    now = datetime.now()
+    db.session.add_all([
+        IdempotencyKey(idempotency_key='old', fingerprint='f', created_at=now - timedelta(seconds=idempotency.TTL_SECONDS + 1)),
+        IdempotencyKey(idempotency_key='new', fingerprint='f', created_at=now),
+    ])
+    db.session.commit()
+    assert idempotency.purge_expired(now) == 1
+    assert db.session.get(IdempotencyKey, 'new') is not None
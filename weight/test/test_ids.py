@@ -0,0 +1,29 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from ids import EPOCH_MS, MAX_NODE_ID, IdAllocator
+
+
+# Test that ids stay unique and increasing when many are taken in one millisecond
+def test_ids_unique_and_increasing_within_one_millisecond():
+    allocator = IdAllocator(3, clock=lambda: EPOCH_MS / 1000 + 100)
+    ids = [allocator.next_id() for _ in range(1000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert max(ids) < 2 ** 53
+
+# Test that a clock stepping back does not repeat ids
+def test_ids_survive_clock_going_back():
+    now = [EPOCH_MS / 1000 + 100]
+    allocator = IdAllocator(0, clock=lambda: now[0])
+    first = allocator.next_id()
+    now[0] -= 5
+    assert allocator.next_id() > first
+
+# Test that two nodes never hand out the same id for the same millisecond
+def test_ids_differ_between_nodes():
+    clock = lambda: EPOCH_MS / 1000 + 100  # noqa: E731
+    assert IdAllocator(1, clock=clock).next_id() != IdAllocator(2, clock=clock).next_id()
+    with pytest.raises(ValueError):
+        IdAllocator(MAX_NODE_ID + 1)
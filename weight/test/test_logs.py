@@ -0,0 +1,48 @@
+import sys
+import os
+import json
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask
+import logs
+
+
+# Test that a debug call below the level never formats its arguments
+def test_debug_arguments_not_formatted_above_debug():
+    formatted = []
+
+    class Expensive:
+        def __str__(self):
+            formatted.append(True)
+            return 'big'
+
+    logger = logging.getLogger('test_logs.lazy')
+    logger.setLevel(logging.INFO)
+    logger.debug("items %s", Expensive())
+    assert formatted == []
+
+# Test that the caller's X-Request-ID is used and echoed, and one is generated otherwise
+def test_request_id_taken_from_header_or_generated():
+    app = Flask(__name__)
+    logs.setup_logging(app)
+
+    @app.route('/id')
+    def request_id():
+        return logs.current_request_id()
+
+    client = app.test_client()
+    res = client.get('/id', headers={logs.REQUEST_ID_HEADER: 'abc123'})
+    assert res.get_data(as_text=True) == 'abc123'
+    assert res.headers[logs.REQUEST_ID_HEADER] == 'abc123'
+    generated = client.get('/id')
+    assert len(generated.get_data(as_text=True)) == 32
+    assert generated.headers[logs.REQUEST_ID_HEADER] == generated.get_data(as_text=True)
+
+# Test that records are rendered as one JSON object carrying the request id
+def test_json_formatter_includes_request_id():
+    record = logging.LogRecord('weight', logging.WARNING, __file__, 1, "invalid date format: %s", ('2025',), None)
+    record.request_id = 'abc123'
+    entry = json.loads(logs.JsonFormatter().format(record))
+    assert entry['message'] == 'invalid date format: 2025'
+    assert entry['request_id'] == 'abc123'
+    assert entry['level'] == 'WARNING'
@@ -0,0 +1,15 @@
+import pytest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# needs the same MYSQL_* environment as the service, e.g. inside the weight_app container
+pytestmark = pytest.mark.skipif(not os.environ.get('MYSQL_HOST'), reason="MYSQL_HOST not set, no database to EXPLAIN against")
+
+
+def test_hot_queries_use_indexes():
+    from api import create_app
+    from commands import find_full_scans
+    app = create_app()
+    with app.app_context():
+        assert find_full_scans() == []
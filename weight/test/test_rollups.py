@@ -0,0 +1,36 @@
+import sys
+import os
+from datetime import datetime
+from unittest.mock import MagicMock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlalchemy.dialects import mysql
+import rollups
+from rollups import bucket_of
+
+
+# Test that a weighing falls into the start of its hour and day
+def test_bucket_of_hour_and_day():
+    when = datetime(2025, 5, 21, 13, 47, 12)
+    assert bucket_of('hour', when) == datetime(2025, 5, 21, 13)
+    assert bucket_of('day', when) == datetime(2025, 5, 21)
+
+# Test that ISO strings from POST /weight are accepted
+def test_bucket_of_iso_string():
+    assert bucket_of('hour', '2025-05-21T13:47:12') == datetime(2025, 5, 21, 13)
+
+# Test that a transaction increments its hour and day rows in one upsert
+def test_record_transaction_increments_both_periods(monkeypatch):
+    mock_db = MagicMock()
+    monkeypatch.setattr(rollups, 'db', mock_db)
+    tx = MagicMock(datetime=datetime(2025, 5, 21, 13, 47), produce='tomato', direction='out', truck='T1', bruto=5000, neto='na')
+
+    rollups.record_transaction(tx)
+
+    stmt = mock_db.session.execute.call_args.args[0]
+    compiled = stmt.compile(dialect=mysql.dialect())
+    sql = str(compiled)
+    assert 'ON DUPLICATE KEY UPDATE' in sql
+    assert 'weight_rollups.count + VALUES(count)' in sql
+    params = compiled.params
+    assert params['period_m0'] == 'hour' and params['period_m1'] == 'day'
+    assert params['neto_m0'] == 0 and params['neto_count_m0'] == 0
@@ -1,13 +1,21 @@
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock
 # from weight.auxillary_functions import lb_to_kg, parse_date, get_transactions_by_time_range
 import sys
 import os
+import io
+import json
 host = os.environ.get('TEST_HOST', 'localhost')
 BASE_URL = f"http://{host}:5000"
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import auxillary_functions
+import batch_jobs
 from auxillary_functions import lb_to_kg, parse_date, get_transactions_by_time_range
+from caches import LRUCache, MISSING
+from sqlalchemy.dialects import mysql
+
+IN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'in')
 
 
 # Test that 2205 pounds is correctly converted to 1000 kilograms
@@ -34,6 +42,31 @@ def test_lb_to_kg_no_conversion_if_weight_not_int():
     assert unit == 'lb'
     assert weight == '2205'
 
+# Test that 'lbs' and float weights, as used by the registry files, are converted too
+def test_lb_to_kg_converts_lbs_and_floats():
+    assert lb_to_kg('lbs', 2205) == ('kg', 1000)
+    assert lb_to_kg('lb', 666.0) == ('kg', 302)
+
+# Test that a registry chunk is normalized to integer kg with the uploaded value kept
+def test_normalize_container_rows():
+    rows = auxillary_functions.normalize_container_rows([
+        {'container_id': 'K-1', 'weight': 666.0, 'unit': 'lbs'},
+        {'container_id': 'C-1', 'weight': 296.6, 'unit': 'kg'},
+    ])
+    assert rows == [
+        {'container_id': 'K-1', 'weight': 302, 'unit': 'kg', 'original_weight': 666.0, 'original_unit': 'lbs'},
+        {'container_id': 'C-1', 'weight': 297, 'unit': 'kg', 'original_weight': 296.6, 'original_unit': 'kg'},
+    ]
+    assert all(type(row['weight']) is int for row in rows)
+
+# Test that pounds are truncated to kg, not rounded, at and above the .5 boundary, as recorded before
+def test_pounds_truncate_at_half_kg():
+    # 221.6025 lb is exactly 100.5 kg, 2204 lb is 999.55 kg
+    for pounds, kg in ((221.6025, 100), (221.8, 100), (2204, 999), (2205, 1000)):
+        assert lb_to_kg('lb', pounds) == ('kg', kg)
+        row = auxillary_functions.normalize_container_rows([{'container_id': 'K-1', 'weight': pounds, 'unit': 'lb'}])[0]
+        assert row['weight'] == kg
+
 # Test parsing a valid date string to datetime object
 def test_parse_date_valid_format():
     date_str = "20250518143000"
@@ -128,3 +161,69 @@ def test_get_transactions_by_time_range_handles_exception():
     )
 
     assert results == []
+
+# Test that a container file is written as one multi-row upsert per chunk
+def test_handle_csv_in_file_upserts_in_chunks(monkeypatch):
+    mock_db = MagicMock()
+    monkeypatch.setattr(auxillary_functions, 'db', mock_db)
+    monkeypatch.setattr(auxillary_functions, 'BATCH_SIZE', 5)
+
+    added, invalid = auxillary_functions.handle_csv_in_file(os.path.join(IN_DIR, 'containers2.csv'), 0, 0)
+
+    statements = [c.args[0] for c in mock_db.session.execute.call_args_list]
+    assert added > 5
+    assert invalid == 0
+    assert len(statements) == -(-added // 5)
+    sql = str(statements[0].compile(dialect=mysql.dialect()))
+    assert 'ON DUPLICATE KEY UPDATE' in sql
+
+def test_import_container_rows_resumes_and_reports_chunks(monkeypatch):
+    upserted = []
+    monkeypatch.setattr(auxillary_functions, 'upsert_containers', lambda rows: upserted.append(list(rows)) or len(rows))
+    monkeypatch.setattr(auxillary_functions, 'BATCH_SIZE', 2)
+    entries = [{'container_id': f"C-{i}", 'weight': i, 'unit': 'kg'} for i in range(5)]
+    entries.insert(1, auxillary_functions.RowError('invalid weight'))
+    entries.insert(3, auxillary_functions.SKIPPED)
+    entries.append(auxillary_functions.RowError('not a JSON object'))
+    chunks = []
+    errors = []
+
+    added, invalid = auxillary_functions.import_container_rows(entries, 1, 0, skip=2, errors=errors,
+                                                               on_chunk=lambda *a: chunks.append(a))
+
+    # C-0 and the first invalid row were handled by the earlier run
+    assert [r['container_id'] for rows in upserted for r in rows] == ['C-1', 'C-2', 'C-3', 'C-4']
+    assert (added, invalid) == (5, 1)
+    assert [chunk[:3] for chunk in chunks] == [(5, 3, 0), (7, 5, 0), (8, 5, 1)]
+    assert [[r['container_id'] for r in chunk[3]] for chunk in chunks] == [['C-1', 'C-2'], ['C-3', 'C-4'], []]
+    assert errors == [{'row': 8, 'error': 'not a JSON object'}]
+
+# Test that only failed jobs and queued or running jobs with a stale heartbeat can be resumed
+def test_can_resume_only_failed_or_stale_jobs():
+    stale = datetime.now() - timedelta(seconds=batch_jobs.STALE_SECONDS + 1)
+    assert batch_jobs.can_resume(MagicMock(status='failed', updated_at=datetime.now()))
+    assert batch_jobs.can_resume(MagicMock(status='running', updated_at=stale))
+    assert not batch_jobs.can_resume(MagicMock(status='running', updated_at=datetime.now()))
+    assert batch_jobs.can_resume(MagicMock(status='queued', updated_at=stale))
+    assert not batch_jobs.can_resume(MagicMock(status='queued', updated_at=datetime.now()))
+    assert not batch_jobs.can_resume(MagicMock(status='done', updated_at=stale))
+
+def test_iter_json_array_streams_across_chunks():
+    doc = '[{"id": "C-1", "weight": 12.5, "unit": "kg"}, 2.5e3, "a,]b", [1, {"x": "]"}], null]'
+    for chunk_size in (1, 3, 7, 1024):
+        assert list(auxillary_functions.iter_json_array(io.StringIO(doc), chunk_size)) == json.loads(doc)
+    for bad in ('{"id": 1}', '[1, 2', '[1 2]'):
+        with pytest.raises(ValueError):
+            list(auxillary_functions.iter_json_array(io.StringIO(bad), 4))
+
+# Test that remember_latest stores a truck that is not cached and keeps a newer cached record
+def test_remember_latest_on_miss_and_out_of_order(monkeypatch):
+    monkeypatch.setattr(auxillary_functions, 'latest_transactions', LRUCache(2))
+    auxillary_functions.remember_latest({'truck': 'T1', 'datetime': datetime(2025, 5, 21, 10, 30)})
+    auxillary_functions.remember_latest({'truck': 'T1', 'datetime': datetime(2025, 5, 21, 10, 0)})
+    assert auxillary_functions.latest_transactions.get('T1')['datetime'] == datetime(2025, 5, 21, 10, 30)
+
+    # TRUCK_CACHE_SIZE=0, as with several workers: nothing is ever cached and writes still succeed
+    monkeypatch.setattr(auxillary_functions, 'latest_transactions', LRUCache(0))
+    auxillary_functions.remember_latest({'truck': 'T1', 'datetime': datetime(2025, 5, 21, 10, 0)})
+    assert auxillary_functions.latest_transactions.get('T1') is MISSING
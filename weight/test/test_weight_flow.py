@@ -0,0 +1,145 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from classes_db import BatchJob, Transaction, WeightRollup, db
+from routes import register_routes
+import auxillary_functions
+import batch_jobs
+import caches
+
+IN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'in')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # POST /weight against SQLite with the truck cache disabled, as with TRUCK_CACHE_SIZE=0 on several workers
+    monkeypatch.setattr(caches.latest_transactions, 'capacity', 0)
+    caches.latest_transactions.clear()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    register_routes(app)
+    with app.app_context():
+        db.create_all()
+        auxillary_functions.upsert_containers([{'container_id': 'K1', 'weight': 100, 'unit': 'kg'}])
+        db.session.commit()
+        auxillary_functions.container_taras.load_all()
+        yield app.test_client()
+        auxillary_functions.container_taras.expire()
+
+
+def weigh(client, direction, truck, weight, containers=('K1',), force=False, when='2025-05-21T10:00:00'):
+    return client.post('/weight', json={
+        'direction': direction, 'truck': truck, 'containers': list(containers), 'weight': weight, 'unit': 'kg',
+        'force': force, 'produce': 'orange', 'datetime': when,
+    })
+
+
+# Test that an in and its out are written and paired while nothing is cached
+def test_in_then_out_without_truck_cache(client):
+    entry = weigh(client, 'in', 'T1', 15000, when='2025-05-21T10:00:00')
+    assert entry.status_code == 200
+    exit_ = weigh(client, 'out', 'T1', 6000, when='2025-05-21T10:30:00')
+    assert exit_.status_code == 200
+    assert exit_.get_json()['neto'] == 15000 - 6000 - 100
+    assert caches.latest_transactions.get('T1') is caches.MISSING
+
+    rows = db.session.query(Transaction).order_by(Transaction.datetime).all()
+    assert [t.direction for t in rows] == ['in', 'out']
+    assert rows[1].session_id == rows[0].id
+
+# Test that the previous record read from the DB still drives the in/out rules
+def test_direction_rules_read_previous_record_from_db(client):
+    assert weigh(client, 'in', 'T2', 15000, when='2025-05-21T10:00:00').status_code == 200
+    assert weigh(client, 'in', 'T2', 15000, when='2025-05-21T10:05:00').status_code == 400
+    assert weigh(client, 'in', 'T2', 14000, force=True, when='2025-05-21T10:06:00').status_code == 200
+    assert weigh(client, 'out', 'T2', 6000, when='2025-05-21T10:30:00').get_json()['bruto'] == 14000
+    assert weigh(client, 'out', 'T3', 6000).status_code == 400
+
+# Test that a standalone container weighing is written too
+def test_none_weighing(client):
+    res = weigh(client, 'none', 'na', 500)
+    assert res.status_code == 200
+    assert res.get_json()['neto'] == 400
+
+# Test that a container registered by another process is not marked unknown from a stale tare cache
+def test_registered_container_not_marked_unknown_from_stale_cache(client):
+    auxillary_functions.upsert_containers([{'container_id': 'K2', 'weight': 200, 'unit': 'kg'}])
+    db.session.commit()
+    auxillary_functions.container_taras._taras['K2'] = None  # this process's copy predates the import
+    weigh(client, 'in', 'T4', 15000, containers=('K2', 'X1'))
+    assert auxillary_functions.find_unknown_container_ids() == ['X1']
+
+# Test that weighings land in their hour and day rollup rows, a forced re-weigh replaces bruto, and /stats sums them
+def test_rollups_and_stats(client):
+    weigh(client, 'in', 'T5', 15000, when='2025-05-21T10:00:00')
+    weigh(client, 'out', 'T5', 6000, when='2025-05-21T10:30:00')
+    weigh(client, 'in', 'T6', 14000, when='2025-05-21T11:05:00')
+    weigh(client, 'in', 'T6', 14500, force=True, when='2025-05-21T11:10:00')
+    weigh(client, 'none', 'na', 500, when='2025-05-21T11:20:00')
+
+    rows = db.session.query(WeightRollup.bucket, WeightRollup.direction, WeightRollup.truck, WeightRollup.count,
+                            WeightRollup.bruto, WeightRollup.neto, WeightRollup.neto_count).filter(
+        WeightRollup.period == 'hour').order_by(WeightRollup.bucket, WeightRollup.direction).all()
+    ten, eleven = datetime(2025, 5, 21, 10), datetime(2025, 5, 21, 11)
+    assert rows == [
+        (ten, 'in', 'T5', 1, 15000, 0, 0),
+        (ten, 'out', 'T5', 1, 15000, 8900, 1),
+        (eleven, 'in', 'T6', 1, 14500, 0, 0),
+        (eleven, 'none', 'na', 1, 500, 400, 1),
+    ]
+    day = db.session.query(WeightRollup).filter(WeightRollup.period == 'day').all()
+    assert {r.bucket for r in day} == {datetime(2025, 5, 21)}
+    assert sum(r.count for r in day) == 4
+
+    res = client.get('/stats?period=hour&from=20250521000000&to=20250521235959&group=bucket&filter=in,out')
+    assert res.get_json() == [
+        {'bucket': '20250521100000', 'count': 2, 'bruto': 30000, 'neto': 8900, 'netoCount': 1},
+        {'bucket': '20250521110000', 'count': 1, 'bruto': 14500, 'neto': 0, 'netoCount': 0},
+    ]
+    res = client.get('/stats?period=day&from=20250521000000&to=20250521235959')
+    assert res.get_json() == [{'produce': 'orange', 'count': 4, 'bruto': 45000, 'neto': 9300, 'netoCount': 2}]
+
+
+def queued_job(job_id, seconds_ago):
+    updated = datetime.now() - timedelta(seconds=seconds_ago)
+    db.session.add(BatchJob(id=job_id, filename='containers1.csv', status='queued', rows_done=0, added=0, invalid=0,
+                            created_at=updated, updated_at=updated))
+    db.session.commit()
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    # a private executor, so a test can wait for the jobs it started
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(batch_jobs, 'executor', executor)
+    monkeypatch.setattr(batch_jobs, 'IN_DIR', IN_DIR)
+    monkeypatch.setattr(batch_jobs, '_waiting', set())
+    yield executor
+    executor.shutdown(wait=True)
+
+# Test that a job left queued by a process that restarted can be resumed once its heartbeat is stale, and then runs
+def test_resume_job_orphaned_in_queue(client, jobs):
+    queued_job('fresh', 0)
+    queued_job('orphan', batch_jobs.STALE_SECONDS + 1)
+    assert client.post('/batch-weight/fresh/resume').status_code == 409
+    assert client.post('/batch-weight/orphan/resume').status_code == 202
+    jobs.shutdown(wait=True)
+    db.session.expire_all()
+    job = db.session.get(BatchJob, 'orphan')
+    assert job.status == 'done'
+    assert job.added > 0
+
+# Test that every committed chunk keeps the jobs queued behind it in this process from going stale
+def test_running_job_touches_jobs_queued_in_same_process(client, jobs, monkeypatch):
+    monkeypatch.setattr(auxillary_functions, 'BATCH_SIZE', 5)
+    queued_job('behind', batch_jobs.STALE_SECONDS + 1)
+    batch_jobs._waiting.add('behind')  # as if it sat in this process's executor queue
+    assert client.post('/batch-weight', json={'file': 'containers1.csv'}).status_code == 202
+    jobs.shutdown(wait=True)
+    db.session.expire_all()
+    assert not batch_jobs.can_resume(db.session.get(BatchJob, 'behind'))
@@ -17,8 +17,10 @@ CREATE TABLE IF NOT EXISTS `containers_registered` (
   `container_id` varchar(15) NOT NULL,
   `weight` int(12) DEFAULT NULL,
   `unit` varchar(10) DEFAULT NULL,
+  `original_weight` double DEFAULT NULL,
+  `original_unit` varchar(10) DEFAULT NULL,
   PRIMARY KEY (`container_id`)
-) ENGINE=MyISAM AUTO_INCREMENT=10001 ;
+) ENGINE=InnoDB AUTO_INCREMENT=10001 ;
 
 -- --------------------------------------------------------
 
@@ -27,7 +29,7 @@ CREATE TABLE IF NOT EXISTS `containers_registered` (
 --
 
 CREATE TABLE IF NOT EXISTS `transactions` (
-  `id` int(12) NOT NULL AUTO_INCREMENT,
+  `id` bigint NOT NULL,
   `datetime` datetime DEFAULT NULL,
   `direction` varchar(10) DEFAULT NULL,
   `truck` varchar(50) DEFAULT NULL,
@@ -37,14 +39,102 @@ CREATE TABLE IF NOT EXISTS `transactions` (
   --   "neto": <int> or "na" // na if some of containers unknown
   `neto` int(12) DEFAULT NULL,
   `produce` varchar(50) DEFAULT NULL,
-  'session_id' int(12)
+  `session_id` bigint DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `ix_transactions_truck_datetime` (`truck`, `datetime`),
+  KEY `ix_transactions_datetime_direction` (`datetime`, `direction`),
+  KEY `ix_transactions_session_id` (`session_id`)
+) ENGINE=InnoDB ;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `transaction_containers`
+--
+
+CREATE TABLE IF NOT EXISTS `transaction_containers` (
+  `transaction_id` bigint NOT NULL,
+  `container_id` varchar(15) NOT NULL,
+  PRIMARY KEY (`transaction_id`, `container_id`),
+  KEY `ix_transaction_containers_container_id` (`container_id`)
+) ENGINE=InnoDB ;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `unknown_containers`
+--
+
+CREATE TABLE IF NOT EXISTS `unknown_containers` (
+  `container_id` varchar(15) NOT NULL,
+  PRIMARY KEY (`container_id`)
+) ENGINE=InnoDB ;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `weight_rollups`
+--
+
+CREATE TABLE IF NOT EXISTS `weight_rollups` (
+  `period` varchar(4) NOT NULL,
+  `bucket` datetime NOT NULL,
+  `produce` varchar(50) NOT NULL,
+  `direction` varchar(10) NOT NULL,
+  `truck` varchar(50) NOT NULL,
+  `count` int(12) NOT NULL DEFAULT 0,
+  `bruto` bigint NOT NULL DEFAULT 0,
+  `neto` bigint NOT NULL DEFAULT 0,
+  `neto_count` int(12) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`period`, `bucket`, `produce`, `direction`, `truck`)
+) ENGINE=InnoDB ;
+
+--
+-- Table structure for table `batch_jobs`
+--
+
+CREATE TABLE IF NOT EXISTS `batch_jobs` (
+  `id` varchar(32) NOT NULL,
+  `filename` varchar(255) NOT NULL,
+  `status` varchar(10) NOT NULL,
+  `total_rows` int(12) DEFAULT NULL,
+  `rows_done` int(12) NOT NULL DEFAULT 0,
+  `added` int(12) NOT NULL DEFAULT 0,
+  `invalid` int(12) NOT NULL DEFAULT 0,
+  `error` text DEFAULT NULL,
+  `row_errors` text DEFAULT NULL,
+  `created_at` datetime DEFAULT NULL,
+  `started_at` datetime DEFAULT NULL,
+  `updated_at` datetime DEFAULT NULL,
+  `finished_at` datetime DEFAULT NULL,
   PRIMARY KEY (`id`)
-) ENGINE=MyISAM AUTO_INCREMENT=10001 ;
+) ENGINE=InnoDB ;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `idempotency_keys`
+--
+
+CREATE TABLE IF NOT EXISTS `idempotency_keys` (
+  `idempotency_key` varchar(64) NOT NULL,
+  `fingerprint` varchar(64) NOT NULL,
+  `status_code` int(12) DEFAULT NULL,
+  `response` text DEFAULT NULL,
+  `created_at` datetime NOT NULL,
+  PRIMARY KEY (`idempotency_key`),
+  KEY `ix_idempotency_keys_created_at` (`created_at`)
+) ENGINE=InnoDB ;
 
 show tables;
 
 describe containers_registered;
 describe transactions;
+describe transaction_containers;
+describe unknown_containers;
+describe weight_rollups;
+describe batch_jobs;
+describe idempotency_keys;
 
 
 